@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AppsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'feedback'
+
+    def ready(self):
+        from .search import setup_search_backend
+        post_migrate.connect(setup_search_backend, sender=self)
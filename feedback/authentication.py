@@ -1,11 +1,77 @@
 import os
+import threading
+import time
+from collections import OrderedDict
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
 import jwt
 from rest_framework.authentication import get_authorization_header
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+# Read once at import, instead of on every request.
+AUTH_SECRET_KEY = os.getenv("AUTH_SECRET_KEY")
+
+
+class VerifiedTokenCache:
+    """
+    A bounded, thread safe LRU cache of tokens whose signature has already been verified.
+    An entry is only returned until the token's `exp` claim, so a cached token can never outlive its expiry.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()
+
+    def get(self, raw_token):
+        with self._lock:
+            entry = self._tokens.get(raw_token)
+            if entry is None:
+                return None
+            token, expires_at = entry
+            if expires_at <= time.time():
+                del self._tokens[raw_token]
+                return None
+            self._tokens.move_to_end(raw_token)
+            return token
+
+    def set(self, raw_token, token, expires_at):
+        if not expires_at or self.maxsize <= 0:
+            # Tokens without an expiry are verified on every request.
+            return
+        with self._lock:
+            self._tokens[raw_token] = (token, expires_at)
+            self._tokens.move_to_end(raw_token)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+# One cache per signing key, so a token verified with one key is never trusted by the other backend.
+verified_tokens = VerifiedTokenCache(settings.JWT_VERIFIED_TOKEN_CACHE_SIZE)
+verified_profile_tokens = VerifiedTokenCache(settings.JWT_VERIFIED_TOKEN_CACHE_SIZE)
+
+
+class CachedJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Authenticates a simplejwt access token without a database query.
+    The user is a TokenUser built from the token claims, so `request.user.id` is the user id claim.
+    Tokens that were already verified are served from `verified_tokens` until they expire.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = verified_tokens.get(raw_token)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            verified_tokens.set(raw_token, validated_token, validated_token.get("exp"))
+        return validated_token
 
 
 class CustomAuthentication(BaseAuthentication):
@@ -18,8 +84,10 @@ class CustomAuthentication(BaseAuthentication):
         token = auth_header[1]
 
         try:
-            auth_secret_key = os.getenv("AUTH_SECRET_KEY")
-            decoded_token = jwt.decode(token, auth_secret_key, algorithms=['HS256'])
+            decoded_token = verified_profile_tokens.get(token)
+            if decoded_token is None:
+                decoded_token = jwt.decode(token, AUTH_SECRET_KEY, algorithms=['HS256'])
+                verified_profile_tokens.set(token, decoded_token, decoded_token.get("exp"))
             return decoded_token
         except jwt.ExpiredSignatureError:
             raise AuthenticationFailed('Token has expired')
@@ -0,0 +1,213 @@
+"""
+Write-behind counters for FeedbackModel clicks and views.
+
+Requests only add to a counter, in Redis when the counter cache is django-redis and in process
+memory otherwise. flush_counters() periodically moves the pending counts into the database with
+one batched UPDATE per field, so the read path never takes a row lock. One flush runs at a time, and
+every flush is recorded with its counts (FeedbackCounterFlushModel) so a retried flush is only added once.
+"""
+import logging
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ("clicks", "views")
+FLUSH_BATCH_SIZE = 500
+# A flush holding the lock longer than this is presumed dead, and the next flush may start.
+FLUSH_LOCK_TIMEOUT = 300  # seconds
+# How long the ids of applied flushes are kept, much longer than a failed flush waits to be retried.
+FLUSH_ID_RETENTION = timedelta(days=1)
+
+
+class LocalCounterStore:
+    """ Pending counts held in this process. Only suitable when the flush runs in the same process. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counts = {field: Counter() for field in COUNTER_FIELDS}
+
+    def add(self, field: str, feedback_id: str, amount: int = 1):
+        with self._lock:
+            self._counts[field][feedback_id] += amount
+
+    def take(self, field: str) -> tuple:
+        with self._lock:
+            counts, self._counts[field] = self._counts[field], Counter()
+        return uuid.uuid4(), dict(counts)
+
+    def done(self, field: str):
+        pass
+
+    @contextmanager
+    def flush_lock(self):
+        acquired = self._flush_lock.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._flush_lock.release()
+
+
+class RedisCounterStore:
+    """
+    Pending counts held in one Redis hash per field.
+    A flush renames the hash before reading it so increments that arrive during the flush go into a
+    fresh hash, and gives the renamed hash a flush id. The renamed hash is only deleted once its counts
+    are in the database, and a flush that failed is retried, with the same id, before new counts are taken.
+    """
+    lock_key = "feedback-counters:flush-lock"
+    flush_id_field = "flush-id"
+
+    def __init__(self, alias: str):
+        from django_redis import get_redis_connection
+        self.client = get_redis_connection(alias)
+
+    @staticmethod
+    def get_key(field: str) -> str:
+        return f"feedback-counters:{field}"
+
+    def add(self, field: str, feedback_id: str, amount: int = 1):
+        self.client.hincrby(self.get_key(field), feedback_id, amount)
+
+    def take(self, field: str) -> tuple:
+        """
+        Return the flush id and the counts of the pending flush of a field, starting one if none is pending.
+        :return: (flush id, {feedback id: count}), or (None, {}) if there is nothing to flush.
+        """
+        from redis.exceptions import ResponseError
+
+        key, flushing_key = self.get_key(field), f"{self.get_key(field)}:flushing"
+        if not self.client.exists(flushing_key):
+            try:
+                self.client.renamenx(key, flushing_key)
+            except ResponseError:
+                # No clicks or views were recorded since the last flush.
+                return None, {}
+        self.client.hsetnx(flushing_key, self.flush_id_field, uuid.uuid4().hex)
+        values = {name.decode(): value.decode() for name, value in self.client.hgetall(flushing_key).items()}
+        flush_id = uuid.UUID(values.pop(self.flush_id_field))
+        return flush_id, {feedback_id: int(amount) for feedback_id, amount in values.items()}
+
+    def done(self, field: str):
+        self.client.delete(f"{self.get_key(field)}:flushing")
+
+    @contextmanager
+    def flush_lock(self):
+        """ Hold the flush lock of all workers for the block, which is told whether it was acquired. """
+        from redis.exceptions import WatchError
+
+        token = uuid.uuid4().hex.encode()
+        acquired = bool(self.client.set(self.lock_key, token, nx=True, ex=FLUSH_LOCK_TIMEOUT))
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                # Only release the lock if it has not expired and been taken by another flush.
+                with self.client.pipeline() as pipe:
+                    try:
+                        pipe.watch(self.lock_key)
+                        if pipe.get(self.lock_key) == token:
+                            pipe.multi()
+                            pipe.delete(self.lock_key)
+                            pipe.execute()
+                    except WatchError:
+                        pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_counter_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                alias = settings.FEEDBACK_COUNTER_CACHE_ALIAS
+                if hasattr(getattr(caches[alias], "client", None), "get_client"):
+                    _store = RedisCounterStore(alias)
+                else:
+                    _store = LocalCounterStore()
+    return _store
+
+
+def _record(field: str, feedback_id):
+    try:
+        get_counter_store().add(field, str(feedback_id))
+    except Exception as exc:
+        # A counter is never worth failing the request for.
+        logger.warning("Unable to record feedback %s for %s: %s", field, feedback_id, exc)
+
+
+def record_click(feedback_id):
+    """ Count a click on a feedback. """
+    _record("clicks", feedback_id)
+
+
+def record_view(feedback_id):
+    """ Count a view of a feedback. """
+    _record("views", feedback_id)
+
+
+def apply_counts(flush_id, field: str, counts: dict) -> int:
+    """
+    Add the counts of a flush to FeedbackModel, unless the flush was already applied.
+    :param flush_id: The id the store gave the flush
+    :param field: One of COUNTER_FIELDS
+    :param counts: The counts of the flush, by feedback id
+    :return: The number of feedback updated.
+    """
+    from .models import FeedbackCounterFlushModel, FeedbackModel
+
+    items = list(counts.items())
+    with transaction.atomic():
+        _, created = FeedbackCounterFlushModel.objects.get_or_create(id=flush_id, defaults={"field": field})
+        if not created:
+            # The counts were committed by a flush that failed before clearing them from the store.
+            return 0
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            increment = Case(
+                *[When(pk=feedback_id, then=Value(amount)) for feedback_id, amount in batch],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            # updated_at is left alone, so counting a view never changes the ETag of the feedback it counts.
+            FeedbackModel.objects.filter(pk__in=[feedback_id for feedback_id, _ in batch]).update(
+                **{field: Coalesce(F(field), Value(0)) + increment}
+            )
+    return len(items)
+
+
+def flush_counters() -> dict:
+    """
+    Add the pending counts to FeedbackModel with one UPDATE per field and batch of feedback.
+    Returns without flushing if another flush is running.
+    :return: The number of feedback updated per field.
+    """
+    from .models import FeedbackCounterFlushModel
+
+    store = get_counter_store()
+    flushed = {}
+    with store.flush_lock() as acquired:
+        if not acquired:
+            logger.info("Skipping the feedback counters flush, another flush is running")
+            return flushed
+        for field in COUNTER_FIELDS:
+            flush_id, counts = store.take(field)
+            flushed[field] = apply_counts(flush_id, field, counts) if counts else 0
+            store.done(field)
+        FeedbackCounterFlushModel.objects.filter(flushed_at__lt=timezone.now() - FLUSH_ID_RETENTION).delete()
+    return flushed
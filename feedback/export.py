@@ -0,0 +1,95 @@
+"""
+Streaming export of feedback as NDJSON or gzipped CSV.
+
+The feedback are read with QuerySet.iterator(), a server-side cursor on PostgreSQL, one chunk at a time.
+The screenshots and owners of a chunk are resolved with one query each, and every chunk is encoded and
+handed out before the next one is read, so memory stays the same however many rows are exported.
+"""
+import csv
+import io
+import zlib
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import ListFeedbackSerializer
+
+# Export format -> (content type, file extension)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("application/gzip", "csv.gz"),
+}
+# The owner fields only exported when the fieldset names them, such as ?fields=id,title,owner.email.
+OWNER_CONTACT_FIELDS = ("email", "phone_no", "address", "date_joined")
+
+
+def get_export_fieldset(fieldset):
+    """
+    Return the fieldset of an export, which omits the owner's contact fields the fieldset does not name.
+    :param fieldset: The requested fieldset (shared.fieldsets), or None
+    """
+    include, omit = fieldset or (None, None)
+    omit = dict(omit or {})
+    if omit.get("owner") == {}:
+        # The whole owner is omitted.
+        return include, omit
+    requested = (include or {}).get("owner") or {}
+    owner_omit = dict(omit.get("owner") or {})
+    owner_omit.update({field: {} for field in OWNER_CONTACT_FIELDS if field not in requested})
+    if owner_omit:
+        omit["owner"] = owner_omit
+    return include, omit or None
+
+
+def iter_feedback_chunks(queryset, chunk_size: int, context=None):
+    """
+    Serialize the feedback of the queryset a chunk at a time.
+    :param queryset: A FeedbackModel queryset. Screenshots it prefetches are fetched per chunk.
+    :param chunk_size: The number of feedback read and serialized at a time
+    :param context: The ListFeedbackSerializer context
+    :return: An iterator of lists of serialized feedback
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield ListFeedbackSerializer(chunk, many=True, context=context or {}).data
+
+
+def iter_ndjson(chunks):
+    """ Encode the chunks as newline delimited JSON, one feedback per line. """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    for chunk in chunks:
+        yield "".join(f"{encoder.encode(row)}\n" for row in chunk).encode()
+
+
+def iter_gzipped_csv(chunks, fieldnames: list):
+    """ Encode the chunks as gzipped CSV. Nested values, like the owner and screenshots, are written as JSON. """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    for chunk in chunks:
+        writer.writerows(
+            {field: encoder.encode(value) if isinstance(value, (dict, list)) else value for field, value in row.items()}
+            for row in chunk
+        )
+        compressed = compressor.compress(buffer.getvalue().encode())
+        buffer.seek(0)
+        buffer.truncate()
+        if compressed:
+            yield compressed
+    yield compressor.compress(buffer.getvalue().encode()) + compressor.flush()
+
+
+def export_feedback(queryset, export_format: str, chunk_size: int, context=None):
+    """
+    Stream the feedback of the queryset in an export format.
+    :param context: The ListFeedbackSerializer context. Its fieldset is narrowed by get_export_fieldset().
+    :return: An iterator of bytes
+    """
+    context = dict(context or {})
+    context["fieldset"] = get_export_fieldset(context.get("fieldset"))
+    chunks = iter_feedback_chunks(queryset, chunk_size, context)
+    if export_format == "csv":
+        return iter_gzipped_csv(chunks, list(ListFeedbackSerializer(context=context).fields))
+    return iter_ndjson(chunks)
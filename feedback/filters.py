@@ -1,6 +1,8 @@
 import django_filters
+from rest_framework import filters
 
 from feedback.models import FeedbackModel
+from feedback.search import search_feedback
 
 
 class FeedbackFilters(django_filters.FilterSet):
@@ -10,3 +12,23 @@ class FeedbackFilters(django_filters.FilterSet):
     class Meta:
         model = FeedbackModel
         fields = ["category"]
+
+
+class FeedbackSearchFilter(filters.SearchFilter):
+    """
+    Full-text search filter for Feedback.
+    Uses the same `search` query parameter as DRF's SearchFilter, but matches through the
+    database's full-text index instead of ILIKE scans.
+    It only filters: the list stays in the (created_at, id) order its keyset pagination needs, so the
+    matches are not ranked. The search action (/api/v1/feedback/search/?q=) returns them by relevance.
+    """
+    search_description = (
+        "Only return feedback matching these words, newest first. "
+        "Use /api/v1/feedback/search/?q= for the matches ranked by relevance."
+    )
+
+    def filter_queryset(self, request, queryset, view):
+        search_term = request.query_params.get(self.search_param, "")
+        if not search_term.strip():
+            return queryset
+        return search_feedback(queryset, search_term)
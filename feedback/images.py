@@ -0,0 +1,105 @@
+"""
+Screenshot derivatives.
+
+Every uploaded screenshot is resized in the background into a few sizes, encoded as WebP
+(or JPEG where Pillow has no WebP support), and the stored paths are recorded on the ImageModel.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+# Variant name -> the longest side in pixels. Images are never upscaled.
+IMAGE_VARIANTS = {
+    "thumbnail": 320,
+    "medium": 720,
+    "large": 1440,
+}
+IMAGE_VARIANT_QUALITY = 80
+
+
+def get_variant_format() -> tuple:
+    """ Return the Pillow format and file extension the variants are encoded with. """
+    if features.check("webp"):
+        return "WEBP", "webp"
+    return "JPEG", "jpg"
+
+
+def encode_variant(image: Image.Image, size: int, image_format: str) -> bytes:
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    if image_format == "JPEG" and variant.mode != "RGB":
+        variant = variant.convert("RGB")
+    elif variant.mode not in ("RGB", "RGBA"):
+        variant = variant.convert("RGBA")
+    buffer = BytesIO()
+    variant.save(buffer, image_format, quality=IMAGE_VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def create_image_variants(image_obj) -> dict:
+    """
+    Create the variants of a screenshot and record them on the ImageModel.
+    The variants are only recorded if the screenshot was not replaced while they were created,
+    and the files of the variants they replace are deleted.
+    :param image_obj: The ImageModel to process
+    :return: A dict of variant name -> stored path
+    """
+    source = image_obj.image.name
+    storage = image_obj.image.storage
+    with storage.open(source, "rb") as image_file:
+        image = Image.open(image_file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    image_format, extension = get_variant_format()
+    variants = {}
+    for name, size in IMAGE_VARIANTS.items():
+        content = ContentFile(encode_variant(image, size, image_format))
+        variants[name] = storage.save(f"images/variants/{image_obj.pk}/{name}.{extension}", content)
+
+    updated = type(image_obj).objects.filter(pk=image_obj.pk, image=source).update(
+        variants=variants, variants_source=source
+    )
+    if updated:
+        from .models import FeedbackModel
+        # The feedback showing the screenshot now link to the variants.
+        FeedbackModel.objects.screenshots_changed([image_obj.pk])
+        stale_paths = set(image_obj.variants.values()) - set(variants.values())
+    else:
+        # The screenshot was replaced or deleted in the meantime, so these variants are stale.
+        stale_paths, variants = set(variants.values()), {}
+    for path in stale_paths:
+        storage.delete(path)
+    return variants
+
+
+def upload_files(field, instances, files) -> list:
+    """
+    Save the uploaded files to the field's storage in parallel on a bounded thread pool.
+    If any upload fails, the files that were saved are deleted again and the first error is raised.
+    :param field: The FileField the files are saved for
+    :param instances: The model instances the file names are generated for, one per file
+    :param files: The uploaded files
+    :return: The stored names, in the order of the files
+    """
+    storage = field.storage
+
+    def upload(instance, file):
+        name = field.generate_filename(instance, file.name)
+        return storage.save(name, file, max_length=field.max_length)
+
+    workers = max(1, min(settings.SCREENSHOT_UPLOAD_WORKERS, len(files)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(upload, instance, file) for instance, file in zip(instances, files)]
+        wait(futures)
+
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        for future in futures:
+            if future.exception() is None:
+                storage.delete(future.result())
+        raise errors[0]
+    return [future.result() for future in futures]
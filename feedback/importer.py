@@ -0,0 +1,181 @@
+"""
+Bulk import of feedback from JSON Lines.
+
+Every line is one feedback in the shape of FeedbackImportSerializer. The file is read a batch of lines at
+a time, and each batch is validated and written in one transaction: the feedback, their screenshots, the
+screenshot links and the LIST_APP timeline events. On PostgreSQL the rows are written with COPY, elsewhere
+with one bulk INSERT per table.
+
+An import is resumable. Lines without an id get one derived from their content, every other row id is
+derived from the feedback id, and the feedback of a batch that already exist are skipped, so a batch
+written twice after a failure is only imported once. The byte offset after the last committed batch is
+returned with every batch so the caller can checkpoint it and seek past the imported lines on a restart.
+"""
+import io
+import json
+import uuid
+
+from django.db import connections, router, transaction
+from django.db.models import AutoField
+from rest_framework.exceptions import ValidationError
+
+from shared.cache import invalidate_tags
+from timeline.feed import add_to_feeds
+from timeline.models import TimelineModel
+from .models import FeedbackModel, ImageModel
+from .serializers import FeedbackImportSerializer
+
+# The namespace of the ids derived for imported rows. Never change it, or re-imports create duplicates.
+IMPORT_NAMESPACE = uuid.UUID("6f1d2c4e-8a7b-4c1e-9f0a-3b5d7e9c1a2f")
+
+
+def get_copy_value(field, obj, connection) -> str:
+    """ Format a field of a model instance for the text format of PostgreSQL's COPY. """
+    value = field.get_db_prep_save(field.pre_save(obj, add=True), connection)
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(model, objs, using: str):
+    """
+    Insert the model instances with one COPY ... FROM STDIN.
+    Auto-incremented primary keys are left to the database, and like bulk_create, save() is not called.
+    """
+    connection = connections[using]
+    fields = [field for field in model._meta.concrete_fields if not isinstance(field, AutoField)]
+    buffer = io.StringIO()
+    for obj in objs:
+        buffer.write("\t".join(get_copy_value(field, obj, connection) for field in fields))
+        buffer.write("\n")
+    buffer.seek(0)
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN", buffer)
+
+
+def insert_rows(model, objs):
+    """ Insert the model instances with COPY on PostgreSQL and with bulk_create elsewhere. """
+    if not objs:
+        return
+    using = router.db_for_write(model)
+    if connections[using].vendor == "postgresql":
+        copy_rows(model, objs, using)
+    else:
+        model.objects.using(using).bulk_create(objs)
+
+
+def exclude_existing(model, objs) -> list:
+    """ Return the model instances whose primary key is not in the database yet. """
+    if not objs:
+        return objs
+    existing = set(model.objects.filter(pk__in=[obj.pk for obj in objs]).values_list("pk", flat=True))
+    return [obj for obj in objs if obj.pk not in existing]
+
+
+def read_batches(file, batch_size: int, offset: int = 0, line_number: int = 0):
+    """
+    Read the lines of a binary file a batch at a time, skipping blank lines.
+    :param file: The JSON Lines file, opened in binary mode
+    :param batch_size: The number of lines per batch
+    :param offset: The byte offset to start reading at
+    :param line_number: The number of the line before the offset
+    :return: An iterator of (lines, offset after the batch, number of the last line read), where each line
+        is a (line number, bytes) pair.
+    """
+    file.seek(offset)
+    batch = []
+    for line_number, line in enumerate(file, start=line_number + 1):
+        offset += len(line)
+        if line.strip():
+            batch.append((line_number, line))
+        if len(batch) >= batch_size:
+            yield batch, offset, line_number
+            batch = []
+    if batch:
+        yield batch, offset, line_number
+
+
+def validate_lines(lines) -> tuple:
+    """
+    Parse and validate a batch of lines.
+    :return: A (rows, errors) pair. The rows are validated data by feedback id, in the order of the lines,
+        and the errors are (line number, error) pairs of the lines that were rejected.
+    """
+    serializer = FeedbackImportSerializer()
+    rows, errors = {}, []
+    for line_number, line in lines:
+        try:
+            data = serializer.run_validation(json.loads(line))
+        except ValueError as exc:
+            errors.append((line_number, f"Invalid JSON: {exc}"))
+            continue
+        except ValidationError as exc:
+            errors.append((line_number, exc.detail))
+            continue
+        data.setdefault("id", uuid.uuid5(IMPORT_NAMESPACE, line.strip().decode()))
+        rows[data["id"]] = data
+    return list(rows.values()), errors
+
+
+@transaction.atomic
+def import_rows(rows, create_variants: bool = True) -> int:
+    """
+    Write validated feedback rows that do not exist yet, with their screenshots and timeline events.
+    :param rows: The validated data of FeedbackImportSerializer, each with an id
+    :param create_variants: Whether to queue the resized variants of the screenshots after commit
+    :return: The number of feedback imported
+    """
+    feedbacks, images, links, timelines = [], [], [], []
+    link_model = FeedbackModel.screenshot.through
+    screenshots = {}
+    for row in rows:
+        feedback_screenshots = row.pop("screenshot", [])
+        feedback = FeedbackModel(**row)
+        screenshots[feedback.id] = feedback_screenshots
+        feedbacks.append(feedback)
+    feedbacks = exclude_existing(FeedbackModel, feedbacks)
+    for feedback in feedbacks:
+        for name in dict.fromkeys(screenshots[feedback.id]):
+            image = ImageModel(id=uuid.uuid5(feedback.id, name), image=name)
+            images.append(image)
+            links.append(link_model(feedbackmodel_id=feedback.id, imagemodel_id=image.id))
+        # Written straight to the timeline, as the outbox drain would, in this same transaction.
+        timelines.append(TimelineModel(
+            id=uuid.uuid5(feedback.id, "LIST_APP"), created_at=feedback.created_at,
+            user=feedback.owner, app=feedback.id, entity="APP", category="LIST_APP",
+        ))
+
+    # Deleting a feedback leaves its screenshots and timeline events behind, so a feedback imported
+    # again after it was deleted links its screenshots back instead of inserting them twice.
+    images = exclude_existing(ImageModel, images)
+    timelines = exclude_existing(TimelineModel, timelines)
+    for model, objs in ((FeedbackModel, feedbacks), (ImageModel, images), (link_model, links), (TimelineModel, timelines)):
+        insert_rows(model, objs)
+    if feedbacks:
+        invalidate_tags("feedback", "timeline")
+        transaction.on_commit(lambda: add_to_feeds(timelines))
+    if create_variants:
+        for image in images:
+            transaction.on_commit(image.enqueue_variants)
+    return len(feedbacks)
+
+
+def import_feedback(file, batch_size: int, offset: int = 0, line_number: int = 0, create_variants: bool = True):
+    """
+    Import the feedback of a JSON Lines file, one transaction per batch.
+    :param file: The file, opened in binary mode
+    :param batch_size: The number of lines per batch
+    :param offset: The byte offset to resume at, as returned with an earlier batch
+    :param line_number: The line number to resume at, as returned with an earlier batch
+    :param create_variants: Whether to queue the resized variants of the screenshots
+    :return: An iterator of a dict per committed batch with the lines read, the feedback imported, the
+        rejected lines as (line number, error) pairs, and the byte offset and line number to resume at
+    """
+    for lines, next_offset, last_line_number in read_batches(file, batch_size, offset, line_number):
+        rows, errors = validate_lines(lines)
+        imported = import_rows(rows, create_variants) if rows else 0
+        yield {
+            "read": len(lines), "imported": imported, "errors": errors,
+            "offset": next_offset, "line_number": last_line_number,
+        }
@@ -0,0 +1,87 @@
+import json
+import os
+from contextlib import redirect_stdout
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from shared.benchmark import compare_reports, get_scenarios, run_benchmarks, seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a fresh SQLite database and benchmark the feedback, timeline, user and token endpoints. '
+        'Run with DJANGO_SETTINGS_MODULE=feedback_api.benchmark_settings'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='The number of users seeded')
+        parser.add_argument('--feedback', type=int, default=2000, help='The number of feedback seeded')
+        parser.add_argument('--screenshots', type=int, default=3, help='The number of screenshots per feedback')
+        parser.add_argument('--timeline', type=int, default=5000, help='The number of timeline events seeded')
+        parser.add_argument('--seed', type=int, default=0, help='The seed of the generated dataset')
+        parser.add_argument('--iterations', type=int, default=100, help='The number of timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='The number of untimed requests per scenario')
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Let responses be served from the response cache instead of clearing it before every request'
+        )
+        parser.add_argument('--scenario', action='append', help='Only run this scenario. Can be repeated')
+        parser.add_argument('--output', help='The file to write the JSON report to. Defaults to stdout')
+        parser.add_argument('--compare', help='A JSON report of an earlier run to compare this run to')
+
+    def handle(self, *args, **kwargs):
+        if not getattr(settings, 'BENCHMARK', False):
+            raise CommandError(
+                'The benchmark replaces the database. Run it with DJANGO_SETTINGS_MODULE=feedback_api.benchmark_settings'
+            )
+        if min(kwargs['users'], kwargs['feedback'], kwargs['screenshots'], kwargs['iterations']) < 1:
+            raise CommandError('--users, --feedback, --screenshots and --iterations must be at least 1.')
+
+        # Start from an empty database with the current schema, so runs on different commits are comparable.
+        database_path = settings.DATABASES['default']['NAME']
+        os.makedirs(os.path.dirname(database_path), exist_ok=True)
+        connection.close()
+        if os.path.exists(database_path):
+            os.remove(database_path)
+        call_command('migrate', run_syncdb=True, verbosity=0)
+
+        dataset = {
+            'users': kwargs['users'], 'feedback': kwargs['feedback'], 'screenshots': kwargs['screenshots'],
+            'timeline': kwargs['timeline'], 'seed': kwargs['seed'],
+        }
+        self.stderr.write(f"Seeding {dataset}...")
+        # Anything the views and serializers print is dropped, so the report is the only output on stdout.
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            ids = seed(kwargs['users'], kwargs['feedback'], kwargs['screenshots'], kwargs['timeline'], kwargs['seed'])
+
+            setup_test_environment()
+            try:
+                scenarios = get_scenarios(ids)
+                if kwargs['scenario']:
+                    unknown = set(kwargs['scenario']) - {scenario.name for scenario in scenarios}
+                    if unknown:
+                        raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+                    scenarios = [scenario for scenario in scenarios if scenario.name in kwargs['scenario']]
+                report = run_benchmarks(
+                    scenarios, kwargs['iterations'], kwargs['warmup'], kwargs['warm_cache'], seeded=dataset
+                )
+            finally:
+                teardown_test_environment()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if kwargs['output']:
+            with open(kwargs['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Benchmark report written to {kwargs['output']}."))
+        else:
+            self.stdout.write(output)
+
+        if kwargs['compare']:
+            with open(kwargs['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+            for line in compare_reports(baseline, report):
+                self.stderr.write(line)
@@ -0,0 +1,39 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from feedback.export import EXPORT_FORMATS, export_feedback
+from feedback.models import FeedbackModel
+from shared.fieldsets import parse_fieldset
+
+
+class Command(BaseCommand):
+    help = 'Export every feedback as NDJSON or gzipped CSV, streamed a chunk at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help='The file to write the export to. Defaults to stdout')
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.FEEDBACK_EXPORT_CHUNK_SIZE,
+            help='The number of feedback read and serialized at a time'
+        )
+        parser.add_argument(
+            '--fields', default='',
+            help='The comma separated fields to export, like ?fields= of the API. '
+                 'The owner\'s contact fields are only exported when named, like owner.email'
+        )
+
+    def handle(self, *args, **kwargs):
+        queryset = FeedbackModel.objects.with_screenshots().order_by('-created_at', '-id')
+        fieldset = (parse_fieldset(kwargs['fields']), None)
+        chunks = export_feedback(queryset, kwargs['export_format'], kwargs['chunk_size'], {'fieldset': fieldset})
+        output = open(kwargs['output'], 'wb') if kwargs['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if kwargs['output']:
+                output.close()
+        if kwargs['output']:
+            self.stdout.write(self.style.SUCCESS(f"Feedback exported to {kwargs['output']} successfully."))
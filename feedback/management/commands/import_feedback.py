@@ -0,0 +1,74 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from feedback.importer import import_feedback
+
+
+class Command(BaseCommand):
+    help = 'Import feedback from a JSON Lines file, a batch per transaction. An interrupted import resumes from its checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The JSON Lines file to import, one feedback per line')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.FEEDBACK_IMPORT_BATCH_SIZE,
+            help='The number of lines validated and written per transaction'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='The file the position after the last committed batch is kept in. Defaults to <path>.checkpoint'
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and read the file from the start')
+        parser.add_argument(
+            '--skip-variants', action='store_true', help='Do not queue the resized variants of the imported screenshots'
+        )
+
+    def read_checkpoint(self, checkpoint_path: str) -> dict:
+        try:
+            with open(checkpoint_path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except FileNotFoundError:
+            return {"offset": 0, "line_number": 0}
+
+    def write_checkpoint(self, checkpoint_path: str, checkpoint: dict):
+        # Replace the checkpoint atomically, so a crash never leaves a partial one behind.
+        with open(f"{checkpoint_path}.tmp", 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+    def handle(self, *args, **kwargs):
+        checkpoint_path = kwargs['checkpoint'] or f"{kwargs['path']}.checkpoint"
+        checkpoint = {"offset": 0, "line_number": 0} if kwargs['restart'] else self.read_checkpoint(checkpoint_path)
+        if checkpoint["offset"]:
+            self.stdout.write(f"Resuming after line {checkpoint['line_number']}.")
+
+        read = imported = rejected = 0
+        started = time.monotonic()
+        with open(kwargs['path'], 'rb') as file:
+            batches = import_feedback(
+                file, kwargs['batch_size'], checkpoint["offset"], checkpoint["line_number"],
+                create_variants=not kwargs['skip_variants'],
+            )
+            for batch in batches:
+                self.write_checkpoint(checkpoint_path, {"offset": batch["offset"], "line_number": batch["line_number"]})
+                for line_number, error in batch["errors"]:
+                    self.stderr.write(f"Line {line_number}: {error}")
+                read += batch["read"]
+                imported += batch["imported"]
+                rejected += len(batch["errors"])
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"Line {batch['line_number']}: {imported} imported, {rejected} rejected, "
+                    f"{read / max(elapsed, 1e-6):.0f} rows/s"
+                )
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{imported} feedback imported, {read - imported - rejected} already imported, {rejected} rejected "
+            f"in {elapsed:.1f}s ({read / max(elapsed, 1e-6):.0f} rows/s)."
+        ))
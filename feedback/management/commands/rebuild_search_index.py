@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from feedback.models import FeedbackModel
+from feedback.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Create the feedback full-text search index and backfill it from the feedback table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='The database alias to rebuild the index on')
+
+    def handle(self, *args, **kwargs):
+        using = kwargs['database']
+        backend = get_search_backend(FeedbackModel, using=using)
+        if backend is None:
+            self.stdout.write(self.style.ERROR(
+                f"The '{connections[using].vendor}' database has no full-text search support."
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilding the feedback search index with {type(backend).__name__}..."))
+        backend.rebuild(connections[using])
+        self.stdout.write(self.style.SUCCESS("Feedback search index rebuilt successfully."))
@@ -1,13 +1,108 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from shared.cache import invalidate_tags
+from shared.fieldsets import is_selected
 
 
 class ImageModelManager(models.Manager):
-    ...
+
+    def create_many(self, files) -> list:
+        """
+        Create an image for each uploaded file. The files are uploaded to storage in parallel,
+        then every row is inserted with one bulk INSERT and their variants are queued after commit.
+        :param files: The uploaded files
+        :return: The created images, in the order of the files
+        """
+        from .images import upload_files
+
+        files = list(files)
+        if not files:
+            return []
+        images = [self.model() for _ in files]
+        names = upload_files(self.model._meta.get_field("image"), images, files)
+        for image, name in zip(images, names):
+            image.image = name
+        # bulk_create skips ImageModel.save(), so the variants are queued here.
+        images = self.bulk_create(images)
+        for image in images:
+            transaction.on_commit(image.enqueue_variants)
+        return images
 
 class FeedbackModelManager(models.Manager):
     # def get_by_natural_key(self, app_name):
     #     return self.get(name=app_name)
-    pass
+
+    def with_screenshots(self):
+        """
+        Prefetch the screenshots of every feedback in one query, reading only the columns the
+        FeedbackImageSerializer needs.
+        """
+        image_model = self.model._meta.get_field("screenshot").related_model
+        return self.get_queryset().prefetch_related(
+            models.Prefetch("screenshot", queryset=image_model.objects.only("id", "image", "variants", "variants_source"))
+        )
+
+    def for_fieldset(self, fieldset=None):
+        """ Prefetch the screenshots, unless the sparse fieldset (shared.fieldsets) leaves them out. """
+        if is_selected(fieldset, "screenshot"):
+            return self.with_screenshots()
+        return self.get_queryset()
+
+    def screenshots_changed(self, image_ids):
+        """
+        Mark the feedback showing any of the screenshots as updated, and invalidate their cached responses.
+        Call it before the screenshots are deleted, while the feedback can still be found through them.
+        """
+        feedback_ids = list(self.filter(screenshot__in=image_ids).values_list("pk", flat=True).distinct())
+        if feedback_ids:
+            self.filter(pk__in=feedback_ids).update(updated_at=timezone.now())
+        invalidate_tags("feedback", *[f"feedback:{feedback_id}" for feedback_id in feedback_ids])
+
+    def title_exists(self, title: str) -> bool:
+        """
+        Case-insensitive check for an existing feedback title.
+        Compares LOWER(title) on both sides so the lookup is served by the lower(title) index.
+        """
+        return self.get_queryset().alias(title_lower=Lower("title")).filter(
+            title_lower=Lower(models.Value(title))
+        ).exists()
+
+
+class LikesModelManager(models.Manager):
+
+    def is_liked(self, app_id, user_id) -> bool:
+        return self.filter(app=app_id, user=user_id).exists()
+
+    def liked_app_ids(self, user_id, app_ids) -> set:
+        """ Return which of the app ids the user has liked, with one query. """
+        return set(self.filter(user=user_id, app__in=app_ids).values_list("app", flat=True))
+
+    @transaction.atomic
+    def toggle(self, app_id, user_id) -> bool:
+        """
+        Like the app for the user, or unlike it if already liked, and update the app's likes_count.
+        :raises FeedbackModel.DoesNotExist: If the app does not exist. Nothing is written.
+        :return: True if the app is now liked by the user.
+        """
+        feedback_model = self.model._meta.apps.get_model("feedback", "FeedbackModel")
+        deleted, _ = self.filter(app=app_id, user=user_id).delete()
+        if deleted:
+            liked, delta = False, -1
+        else:
+            try:
+                with transaction.atomic():
+                    self.create(app=app_id, user=user_id)
+                liked, delta = True, 1
+            except IntegrityError:
+                # A concurrent request has just liked it, and that request counts the like.
+                liked, delta = True, 0
+        if not feedback_model.objects.filter(pk=app_id).update(
+            likes_count=models.F("likes_count") + delta, updated_at=timezone.now()
+        ):
+            raise feedback_model.DoesNotExist
+        return liked
 
 
 class VersionModelManager(models.Manager):
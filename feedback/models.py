@@ -1,13 +1,17 @@
+import logging
 import uuid
 
 # from django.contrib.postgres.indexes import GinIndex
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 from .enums import APP_STAGE, PLAYSTORE_APPS_CATEGORY
-from .managers import FeedbackModelManager, ImageModelManager, VersionModelManager
+from .managers import FeedbackModelManager, ImageModelManager, LikesModelManager, VersionModelManager
 from timeline.models import TimelineModel
 
+logger = logging.getLogger(__name__)
+
 
 class ImageModel(models.Model):
     """
@@ -17,10 +21,38 @@ class ImageModel(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, null=False)
     image = models.FileField(upload_to="images", null=True, blank=True)
+    variants = models.JSONField(
+        default=dict, blank=True, help_text="The stored paths of the resized variants of the image, by variant name."
+    )
+    variants_source = models.CharField(
+        max_length=255, default="", blank=True, help_text="The image the variants were created from."
+    )
 
     def __str__(self):
         return f"{self.image.name} -> {self.image.size}"
 
+    def get_variants(self) -> dict:
+        """ Return the variants of the current image, or an empty dict if they are not created yet. """
+        if self.image and self.variants_source == self.image.name:
+            return self.variants
+        return {}
+
+    def save(self, *args, **kwargs):
+        """
+        Override the save method to create the image variants in the background when the image changes.
+        """
+        super(ImageModel, self).save(*args, **kwargs)
+        if self.image and self.variants_source != self.image.name:
+            transaction.on_commit(self.enqueue_variants)
+
+    def enqueue_variants(self):
+        from .tasks import process_screenshot
+        try:
+            process_screenshot.delay(str(self.pk))
+        except Exception as exc:
+            # The original image is served until the variants exist, so a missing worker must not fail the upload.
+            logger.warning("Unable to queue the variants of image %s: %s", self.pk, exc)
+
 
 class FeedbackModel(models.Model):
     """This Model defines Nine Apps Model."""
@@ -41,16 +73,24 @@ class FeedbackModel(models.Model):
     website = models.URLField(max_length=256, default="", blank=True, null=False)
     clicks = models.BigIntegerField(null=True)
     views = models.BigIntegerField(null=True)
+    likes_count = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(default=timezone.now)
+    # Bumped by every write that changes the feedback's representation, except the clicks and views counters.
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ("-created_at",)
+        ordering = ("-created_at", "-id")
         indexes = [
             models.Index(
                 fields=("category", "title"),
                 name="feedback_model_index",
                 # opclasses=("gin_trgm_ops", "gin_trgm_ops", "gin_trgm_ops")
-            )
+            ),
+            # Back the (created_at, id) keyset pagination of the feedback list and a user's feedback.
+            models.Index(fields=("-created_at", "-id"), name="feedback_created_index"),
+            models.Index(fields=("owner", "-created_at", "-id"), name="feedback_owner_created_index"),
+            # Serves the case-insensitive title existence check.
+            models.Index(Lower("title"), name="feedback_title_lower_index"),
             # GinIndex(
             #     fields=["stack", "category", "name"], name="apps_model_index",
             #     opclasses=['gin_trgm_ops', 'gin_trgm_ops', 'gin_trgm_ops']
@@ -70,46 +110,50 @@ class FeedbackModel(models.Model):
         Override the save method to add custom updates to the app instance.
         """
         # self.name_id = self.generate_name_id(str(self.name))
+        adding = self._state.adding
         super(FeedbackModel, self).save(*args, **kwargs)
-        TimelineModel.objects.create_app_timeline(user_id=self.owner, app_id=self.id, category="LIST_APP")
+        # Only listing a new app is a timeline event, updates are not.
+        if adding:
+            TimelineModel.objects.create_app_timeline(user_id=self.owner, app_id=self.id, category="LIST_APP")
 
     def natural_key(self):
         return self.name
 
 
-class LikesUserModel(models.Model):
-    id = models.UUIDField(
-        primary_key=True, default=uuid.uuid4, editable=False, null=False
-    )
-    user_id = models.UUIDField(default=None)
+class LikesModel(models.Model):
+    """
+    One row per user liking a feedback.
+    The number of likes of a feedback is kept on FeedbackModel.likes_count.
+    """
 
+    objects = LikesModelManager()
 
-class LikesModel(models.Model):
+    app = models.UUIDField()
+    user = models.UUIDField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=("app", "user"), name="likes_app_user_unique"),
+        ]
+        indexes = [
+            # Serves the "liked by me" lookup of a page of feedback.
+            models.Index(fields=("user", "app"), name="likes_user_app_index"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} likes {self.app}"
+
+
+class FeedbackCounterFlushModel(models.Model):
     """
-    Spunned from iTheirs Likes Model
+    The flushes of the clicks and views counters (feedback.counters) whose counts are in FeedbackModel.
+    A flush is recorded in the transaction adding its counts, so a flush that is retried is only added once.
     """
 
-    id = models.UUIDField(
-        primary_key=True, default=uuid.uuid4, editable=False, null=False
-    )
-    # user_liking = ArrayField(models.UUIDField(), default=list)
-    # users_liking = models.CharField(
-    #     max_length=1024,
-    #     default="",
-    #     blank=True,
-    #     null=True,
-    #     help_text="Merkle hash of the users liking this app",
-    # )
-    users_liking = models.ManyToManyField(LikesUserModel)
-    app_liked = models.UUIDField()
-    likes_status = models.BooleanField(
-        default=True,
-        blank=False,
-        null=False,
-        help_text="For toggling the like of an operation.",
-    )
-    likes_count = models.BigIntegerField(default=0, blank=True, null=True)
-    likes_datetime = models.DateTimeField(auto_now=True)
+    id = models.UUIDField(primary_key=True, editable=False)
+    field = models.CharField(max_length=10)
+    flushed_at = models.DateTimeField(default=timezone.now, db_index=True)
 
-    def __str__(self) -> int:
-        return int(self.likes_count)
+    def __str__(self):
+        return f"{self.field} flush {self.id}"
@@ -1,11 +1,151 @@
 # Mayowa Obisesan
 # OVERRIDE THE CURSOR PAGINATION CLASS TO SET IT'S ATTRIBUTES
 # July 19, 2022.
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
 
 
 class NinePagination(pagination.CursorPagination):
-    ordering = "created_at"
+    """
+    Keyset pagination over (created_at, id).
+    The cursor holds the created_at and id of the boundary row, and each page is fetched with
+    `(created_at, id) < (cursor created_at, cursor id)`, so every page is a single index range scan
+    with no COUNT(*) and no OFFSET. The (created_at, id) pair is unique, so the offset part of
+    DRF's cursor is never needed.
+    """
+    ordering = ("-created_at", "-id")
     cursor_query_param = 'cursor'
     cursor_query_description = 'Nine Pagination cursor value.'
     invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, queryset, view):
+        # The keyset is only valid for the indexed (created_at, id) ordering,
+        # so the view's OrderingFilter is not consulted.
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*pagination._reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = self.filter_by_position(queryset, current_position, reverse)
+
+        # Always fetch an extra item to determine if there is a page following on from this one.
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def paginate_first_page(self, rows, request):
+        """
+        Paginate the newest rows of a list that is already in this ordering, such as a materialized feed.
+        The next link is a regular cursor, so the following pages are read from the queryset.
+        :param rows: Up to page size + 1 rows, each with a created_at and id
+        :param request: The request
+        :return: The rows of the first page
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = None
+        self.page = list(rows[:self.page_size])
+        self.has_next = len(rows) > self.page_size
+        self.has_previous = False
+        self.next_position = self._get_position_from_instance(self.page[-1], self.ordering) if self.has_next else None
+        self.display_page_controls = self.has_next and self.template is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering) if self.page else self.next_position
+        return self.encode_cursor(pagination.Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering) if self.page else self.previous_position
+        return self.encode_cursor(pagination.Cursor(offset=0, reverse=True, position=position))
+
+    def filter_by_position(self, queryset, position, reverse):
+        """
+        Filter the queryset to the rows strictly after the position in the direction of travel.
+        :param queryset: The ordered queryset
+        :param position: The encoded "created_at|id" position from the cursor
+        :param reverse: Whether the cursor is travelling backwards
+        :return: The filtered queryset
+        """
+        created_at, pk = self.decode_position(position)
+        created_at_field, id_field = (order.lstrip("-") for order in self.ordering)
+        is_reversed = self.ordering[0].startswith("-")
+        lookup = "lt" if reverse != is_reversed else "gt"
+        return queryset.filter(
+            Q(**{f"{created_at_field}__{lookup}": created_at})
+            | Q(**{created_at_field: created_at, f"{id_field}__{lookup}": pk})
+        )
+
+    def decode_position(self, position):
+        try:
+            created_at, pk = position.split("|", 1)
+            created_at = parse_datetime(created_at)
+            pk = uuid.UUID(pk)
+        except (AttributeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def _get_position_from_instance(self, instance, ordering):
+        created_at_field, id_field = (order.lstrip("-") for order in ordering)
+        if isinstance(instance, dict):
+            created_at, pk = instance[created_at_field], instance[id_field]
+        else:
+            created_at, pk = getattr(instance, created_at_field), getattr(instance, id_field)
+        if isinstance(created_at, str):
+            # Already serialized, as in a materialized feed.
+            created_at = parse_datetime(created_at)
+        return f"{created_at.isoformat()}|{pk}"
@@ -0,0 +1,199 @@
+"""
+Full-text search over FeedbackModel.
+
+PostgreSQL keeps a stored, weighted tsvector column (search_vector) generated from the searchable
+fields and backed by a GIN index. SQLite keeps an FTS5 shadow table over the same fields, keyed on a
+stable integer per feedback and kept in sync with triggers on insert, update and delete. Both are
+created after migrate, and both are queried through search_feedback(), which filters a queryset to
+the matches and annotates a `rank` where higher is better.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+
+SEARCH_FIELDS = ("title", "description", "long_description", "category")
+
+# Relative importance of each searchable field, in SEARCH_FIELDS order.
+POSTGRES_WEIGHTS = ("A", "B", "C", "B")
+SQLITE_WEIGHTS = (10.0, 4.0, 1.0, 4.0)
+
+
+def get_search_terms(term: str) -> list:
+    """ Split a user supplied search string into plain word terms, dropping any query syntax. """
+    return re.findall(r"\w+", term or "")
+
+
+class PostgresSearchBackend:
+    """ Ranked search over a generated tsvector column with a GIN index. """
+    config = "english"
+    column = "search_vector"
+    index_name = "feedback_search_vector_idx"
+
+    def __init__(self, model):
+        self.model = model
+        self.table = model._meta.db_table
+
+    def setup(self, connection):
+        document = " || ".join(
+            f"setweight(to_tsvector('{self.config}'::regconfig, coalesce({field}, '')), '{weight}')"
+            for field, weight in zip(SEARCH_FIELDS, POSTGRES_WEIGHTS)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS {self.column} tsvector "
+                f"GENERATED ALWAYS AS ({document}) STORED"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.index_name} ON {self.table} USING GIN ({self.column})"
+            )
+
+    def rebuild(self, connection):
+        # The generated column is recomputed by PostgreSQL on every write, so there is nothing to backfill.
+        self.setup(connection)
+
+    def search(self, queryset, terms: list):
+        query = " ".join(terms)
+        return queryset.extra(
+            select={"rank": f"ts_rank({self.table}.{self.column}, plainto_tsquery('{self.config}', %s))"},
+            select_params=[query],
+            where=[f"{self.table}.{self.column} @@ plainto_tsquery('{self.config}', %s)"],
+            params=[query],
+        )
+
+
+class SQLiteSearchBackend:
+    """
+    Ranked search over an FTS5 external content table that shadows the feedback table.
+    The feedback table has no stable integer key, as its primary key is a UUID and SQLite may renumber its
+    implicit rowids on VACUUM. So every feedback is given an INTEGER PRIMARY KEY in a key table, which is
+    never renumbered, and the FTS5 table reads its content through a view joining the two.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.table = model._meta.db_table
+        self.pk_column = model._meta.pk.column
+        self.fts_table = f"{self.table}_fts"
+        self.keys_table = f"{self.table}_fts_keys"
+        self.content_view = f"{self.table}_fts_content"
+
+    def get_key(self, row: str) -> str:
+        return f"(SELECT fts_key FROM {self.keys_table} WHERE feedback_id = {row}.{self.pk_column})"
+
+    def setup(self, connection):
+        columns = ", ".join(SEARCH_FIELDS)
+        new_values = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+        old_values = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+        with connection.cursor() as cursor:
+            is_new = self.keys_table not in connection.introspection.table_names(cursor)
+            if is_new:
+                # An earlier index keyed on the implicit rowid is replaced.
+                for trigger in ("insert", "delete", "update"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {self.fts_table}_{trigger}")
+                cursor.execute(f"DROP TABLE IF EXISTS {self.fts_table}")
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.keys_table} ("
+                f"fts_key INTEGER PRIMARY KEY, feedback_id TEXT NOT NULL UNIQUE)"
+            )
+            cursor.execute(
+                f"CREATE VIEW IF NOT EXISTS {self.content_view} AS "
+                f"SELECT {self.keys_table}.fts_key, {', '.join(f'{self.table}.{field}' for field in SEARCH_FIELDS)} "
+                f"FROM {self.keys_table} JOIN {self.table} "
+                f"ON {self.table}.{self.pk_column} = {self.keys_table}.feedback_id"
+            )
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5("
+                f"{columns}, content='{self.content_view}', content_rowid='fts_key', tokenize='porter unicode61')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_insert AFTER INSERT ON {self.table} BEGIN "
+                f"INSERT OR IGNORE INTO {self.keys_table}(feedback_id) VALUES (new.{self.pk_column}); "
+                f"INSERT INTO {self.fts_table}(rowid, {columns}) VALUES ({self.get_key('new')}, {new_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_delete AFTER DELETE ON {self.table} BEGIN "
+                f"INSERT INTO {self.fts_table}({self.fts_table}, rowid, {columns}) "
+                f"VALUES ('delete', {self.get_key('old')}, {old_values}); "
+                f"DELETE FROM {self.keys_table} WHERE feedback_id = old.{self.pk_column}; END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.fts_table}_update AFTER UPDATE OF {columns} ON {self.table} BEGIN "
+                f"INSERT INTO {self.fts_table}({self.fts_table}, rowid, {columns}) "
+                f"VALUES ('delete', {self.get_key('old')}, {old_values}); "
+                f"INSERT INTO {self.fts_table}(rowid, {columns}) VALUES ({self.get_key('new')}, {new_values}); END"
+            )
+        if is_new:
+            self.fill(connection)
+
+    def fill(self, connection):
+        """ Give a key to the feedback that have none, drop the keys of deleted feedback and re-read the index. """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR IGNORE INTO {self.keys_table}(feedback_id) SELECT {self.pk_column} FROM {self.table}"
+            )
+            cursor.execute(
+                f"DELETE FROM {self.keys_table} WHERE feedback_id NOT IN (SELECT {self.pk_column} FROM {self.table})"
+            )
+            cursor.execute(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES ('rebuild')")
+
+    def rebuild(self, connection):
+        # Rows written before the triggers existed are keyed and indexed.
+        self.setup(connection)
+        self.fill(connection)
+
+    def search(self, queryset, terms: list):
+        # Quote every term so user input can never be parsed as FTS5 query syntax.
+        query = " ".join(f'"{term}"' for term in terms)
+        weights = ", ".join(str(weight) for weight in SQLITE_WEIGHTS)
+        return queryset.extra(
+            select={"rank": f"-bm25({self.fts_table}, {weights})"},
+            tables=[self.fts_table, self.keys_table],
+            where=[
+                f"{self.fts_table}.rowid = {self.keys_table}.fts_key",
+                f"{self.keys_table}.feedback_id = {self.table}.{self.pk_column}",
+                f"{self.fts_table} MATCH %s",
+            ],
+            params=[query],
+        )
+
+
+SEARCH_BACKENDS = {
+    "postgresql": PostgresSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+}
+
+
+def get_search_backend(model, using="default"):
+    """ Return the search backend for the database vendor behind `using`, or None if it has no full-text support. """
+    backend_class = SEARCH_BACKENDS.get(connections[using].vendor)
+    return backend_class(model) if backend_class else None
+
+
+def search_feedback(queryset, term: str):
+    """
+    Filter the queryset to feedback matching the search term, annotated with `rank` (higher is better).
+    :param queryset: A FeedbackModel queryset
+    :param term: The raw search string from the client
+    :return: The filtered and annotated queryset. It is not ordered by rank, so callers pick the ordering.
+    """
+    terms = get_search_terms(term)
+    if not terms:
+        return queryset.none()
+    backend = get_search_backend(queryset.model, using=queryset.db)
+    if backend is None:
+        # Unsupported databases fall back to a case-insensitive substring match without ranking.
+        condition = Q()
+        for term in terms:
+            condition &= Q(*[Q(**{f"{field}__icontains": term}) for field in SEARCH_FIELDS], _connector=Q.OR)
+        return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
+    return backend.search(queryset, terms)
+
+
+def setup_search_backend(sender, using="default", **kwargs):
+    """ post_migrate receiver that creates the search column, index or shadow table for the feedback table. """
+    from .models import FeedbackModel
+    connection = connections[using]
+    backend = get_search_backend(FeedbackModel, using=using)
+    if backend is not None and FeedbackModel._meta.db_table in connection.introspection.table_names():
+        backend.setup(connection)
@@ -1,67 +1,165 @@
 import base64
+import binascii
 import uuid
+from io import BytesIO
 
-import six
-from django.core.files.base import ContentFile
-from django.db import transaction
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile, UploadedFile
+from django.db import models, transaction
 from django.shortcuts import get_object_or_404
+from PIL import Image
 from rest_framework import serializers
 
-from shared.serializers import BasicListUserSerializer
+from shared.cache import invalidate_tags
+from shared.compiled import CompiledSerializer
+from shared.fieldsets import FieldsetSerializerMixin, get_nested_fieldset
+from shared.serializers import BasicListUserSerializer, get_compiled_users_by_id, get_users_by_id
 from .models import FeedbackModel, ImageModel
 from timeline.models import TimelineModel
 from user.models import User
 
 
 class Base64ImageField(serializers.ImageField):
+    """
+    An ImageField that also accepts a base64 string, optionally as a "data:" URI.
+    The string is decoded a chunk at a time, into memory or into a temporary file once it is larger than
+    FILE_UPLOAD_MAX_MEMORY_SIZE, so a large image is never held in memory as one decoded bytes object.
+    A payload larger than `max_decoded_size` is rejected before it is decoded. The file extension comes
+    from the format Pillow reads from the image header.
+    """
+    default_error_messages = {
+        "max_decoded_size": "Ensure the decoded image is at most {max_decoded_size} bytes.",
+    }
+    # A multiple of 4, so every chunk of base64 characters decodes on its own.
+    chunk_size = 64 * 1024
+
+    def __init__(self, *args, **kwargs):
+        self.max_decoded_size = kwargs.pop("max_decoded_size", settings.BASE64_IMAGE_MAX_DECODED_SIZE)
+        super(Base64ImageField, self).__init__(*args, **kwargs)
+
     def to_internal_value(self, data):
         # Check if this is a base64 string
-        if isinstance(data, six.string_types):
-            # Check if the base64 string is in the "data:" format
-            if 'data:' in data and ';base64,' in data:
-                # Break out the header from the base64 content
-                header, data = data.split(';base64,')
-            # Try to decode the file. Return validation error if it fails.
-            try:
-                decoded_file = base64.b64decode(data)
-            except:
-                # except TypeError:
-                self.fail('invalid_image')
-            # Generate file name:
-            file_name = str(uuid.uuid4())[:12]  # 12 characters are more than enough.
-            # Get the file name extension:
-            file_extension = self.get_file_extension(file_name, decoded_file)
-            complete_file_name = "%s.%s" % (file_name, file_extension,)
-            data = ContentFile(decoded_file, name=complete_file_name)
+        if isinstance(data, str):
+            data = self.decode_base64(data)
         return super(Base64ImageField, self).to_internal_value(data)
 
-    def get_file_extension(self, file_name, decoded_file):
-        import imghdr
-        extension = imghdr.what(file_name, decoded_file)
-        extension = "jpg" if extension == "jpeg" else extension
-        return extension
+    def decode_base64(self, data: str) -> UploadedFile:
+        # Skip the header of a "data:" URI without copying the rest of the string.
+        start = 0
+        if data.startswith("data:"):
+            start = data.find(";base64,")
+            if start == -1:
+                self.fail("invalid_image")
+            start += len(";base64,")
+        # Every 4 base64 characters decode to at most 3 bytes, so oversized payloads fail before decoding.
+        estimated_size = (len(data) - start) // 4 * 3
+        if estimated_size > self.max_decoded_size + 3:
+            self.fail("max_decoded_size", max_decoded_size=self.max_decoded_size)
+
+        # Like Django's upload handlers, small images are decoded in memory and larger ones to a temporary
+        # file on disk, which Pillow then validates from its path instead of from a copy in memory.
+        file_name = str(uuid.uuid4())[:12]  # 12 characters are more than enough.
+        if estimated_size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            decoded_file = TemporaryUploadedFile(file_name, None, 0, None)
+        else:
+            decoded_file = InMemoryUploadedFile(BytesIO(), None, file_name, None, 0, None)
+        try:
+            decoded_file.size = self.decode_chunks(data, start, decoded_file)
+            image_format = self.get_image_format(decoded_file)
+        except serializers.ValidationError:
+            decoded_file.close()
+            raise
+        decoded_file.name = "%s.%s" % (file_name, self.get_file_extension(image_format),)
+        decoded_file.content_type = Image.MIME.get(image_format)
+        return decoded_file
+
+    def decode_chunks(self, data: str, start: int, decoded_file) -> int:
+        """ Decode the base64 string from `start` into the file a chunk at a time, and return the decoded size. """
+        size, remainder = 0, ""
+        try:
+            for offset in range(start, len(data), self.chunk_size):
+                chunk = remainder + "".join(data[offset:offset + self.chunk_size].split())
+                aligned = len(chunk) // 4 * 4
+                chunk, remainder = chunk[:aligned], chunk[aligned:]
+                size += decoded_file.write(base64.b64decode(chunk, validate=True))
+                if size > self.max_decoded_size:
+                    self.fail("max_decoded_size", max_decoded_size=self.max_decoded_size)
+        except (binascii.Error, ValueError):
+            self.fail("invalid_image")
+        if remainder or not size:
+            self.fail("invalid_image")
+        return size
+
+    def get_image_format(self, image_file) -> str:
+        """ Read the image format from the header with Pillow, without decoding the image. """
+        image_file.seek(0)
+        try:
+            with Image.open(image_file) as image:
+                image_format = image.format
+        except (OSError, ValueError, Image.DecompressionBombError):
+            self.fail("invalid_image")
+        image_file.seek(0)
+        return image_format
 
+    @staticmethod
+    def get_file_extension(image_format: str) -> str:
+        extension = image_format.lower()
+        return "jpg" if extension == "jpeg" else extension
 
-class FeedbackSearchSerializer(serializers.ModelSerializer):
+
+class FeedbackSearchSerializer(serializers.Serializer):
+    """
+    This Serializer is for Feedback Search. It only performs validation on the search query parameters.
+    The term is matched against the title, description, long_description and category.
+    """
+    q = serializers.CharField(max_length=256)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class LikedFeedbackSerializer(serializers.Serializer):
     """
-    This Serializer is for Feedback Search. It only performs validation on the app_name fields.
+    This Serializer validates the feedback ids of the bulk "liked by me" lookup.
     """
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=100)
+
+
+class FeedbackImportSerializer(serializers.ModelSerializer):
+    """
+    Validates one line of a bulk import (feedback.importer).
+    Unlike FeedbackSerializer, the id, owner and created_at are taken from the line, and the screenshots are
+    the storage names of files that are already uploaded.
+    """
+    id = serializers.UUIDField(required=False)
+    owner = serializers.UUIDField()
+    screenshot = serializers.ListField(
+        child=serializers.CharField(max_length=100), required=False, default=list
+    )
 
     class Meta:
         model = FeedbackModel
-        fields = ["title", "description", "long_description", "category"]
+        fields = [
+            "id", "owner", "external_link", "category", "website",
+            "title", "description", "long_description", "created_at", "screenshot"
+        ]
 
 
-class FeedbackImageSerializer(serializers.ModelSerializer):
+class FeedbackImageSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    """
+    Returns a screenshot. When the serializer context has an `image_variant` (thumbnail, medium or large)
+    and that variant has been created, `image` is the URL of the variant instead of the original upload.
+    """
     class Meta:
         model = ImageModel
         fields = ["id", "image"]
-    #
-    # def to_representation(self, instance):
-    #     data = super().to_representation(instance)
-    #     request = self.context.get("request")
-    #     # data["image"] = request.META.get("HTTP_REFERER").split(":")[0]+"://"+request.get_host()+instance.image.url
-    #     return data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        variant_path = instance.get_variants().get(self.context.get("image_variant"))
+        if variant_path and "image" in data:
+            url = instance.image.storage.url(variant_path)
+            request = self.context.get("request")
+            data["image"] = request.build_absolute_uri(url) if request is not None else url
+        return data
 
     @transaction.atomic
     def update(self, instance, validated_data):
@@ -81,19 +179,120 @@ class BasicListFeedbackSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class ListFeedbackSerializer(serializers.ModelSerializer):
-    """ Returns a serialized list of Feedback """
+class FeedbackOwnerListSerializer(serializers.ListSerializer):
+    """
+    Resolves the owners of every feedback on the page with one query,
+    instead of one user lookup per row.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        feedback_list = list(iterable)
+        if "owner" in self.child.fields:
+            self.child.owners = get_users_by_id(
+                (feedback.owner for feedback in feedback_list), get_nested_fieldset(self.context.get("fieldset"), "owner")
+            )
+        return [self.child.to_representation(feedback) for feedback in feedback_list]
+
+
+class ListFeedbackSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    """
+    Returns a serialized list of Feedback.
+    The owner and screenshots are only resolved when the sparse fieldset in the context selects them.
+    """
+    owners = None
+
     class Meta:
         model = FeedbackModel
         fields = "__all__"
+        list_serializer_class = FeedbackOwnerListSerializer
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data["owner"] = BasicListUserSerializer(instance=get_object_or_404(User, pk=instance.owner)).data
-        data["screenshot"] = FeedbackImageSerializer(instance=instance.screenshot, many=True, context={"request": self.context.get("request")}).data
+        fieldset = self.context.get("fieldset")
+        if "owner" in data:
+            owners = self.owners
+            if owners is None:
+                owners = get_users_by_id([instance.owner], get_nested_fieldset(fieldset, "owner"))
+            data["owner"] = owners.get(instance.owner)
+        if "screenshot" in data:
+            data["screenshot"] = FeedbackImageSerializer(
+                instance=instance.screenshot.all(), many=True,
+                context={
+                    "request": self.context.get("request"), "image_variant": self.context.get("image_variant"),
+                    "fieldset": get_nested_fieldset(fieldset, "screenshot"),
+                }
+            ).data
         return data
 
 
+class CompiledFeedbackImageSerializer(CompiledSerializer):
+    """ The compiled FeedbackImageSerializer, which picks the same image variant. """
+    serializer_class = FeedbackImageSerializer
+
+    def get_by_feedback_id(self, feedback_ids) -> dict:
+        """
+        Serialize the screenshots of a batch of feedback with one query, the one FeedbackModel.with_screenshots() runs.
+        :return: A dict mapping each feedback id to its serialized screenshots
+        """
+        rows = list(self.get_rows(
+            ImageModel.objects.filter(feedbackmodel__in=feedback_ids),
+            keep=("feedbackmodel", "id", "image", "variants", "variants_source"),
+        ))
+        screenshots = {}
+        for row, screenshot in zip(rows, self.serialize(rows)):
+            screenshots.setdefault(row["feedbackmodel"], []).append(screenshot)
+        return screenshots
+
+    def resolve(self, rows, data):
+        variant = self.context.get("image_variant")
+        if "image" not in self.fields or not variant:
+            return
+        storage = ImageModel._meta.get_field("image").storage
+        request = self.context.get("request")
+        for row, screenshot in zip(rows, data):
+            # ImageModel.get_variants()
+            variants = row["variants"] if row["image"] and row["variants_source"] == row["image"] else {}
+            if variant_path := variants.get(variant):
+                url = storage.url(variant_path)
+                screenshot["image"] = request.build_absolute_uri(url) if request is not None else url
+
+
+class CompiledListFeedbackSerializer(CompiledSerializer):
+    """ The compiled ListFeedbackSerializer. The owners and screenshots of a page are read with one query each. """
+    serializer_class = ListFeedbackSerializer
+    nested_fields = ("owner", "screenshot")
+
+    def resolve(self, rows, data):
+        if "owner" in self.fields:
+            owners = get_compiled_users_by_id(
+                (row["owner"] for row in rows), get_nested_fieldset(self.fieldset, "owner")
+            )
+            for row, feedback in zip(rows, data):
+                feedback["owner"] = owners.get(row["owner"])
+        if "screenshot" in self.fields:
+            screenshots = CompiledFeedbackImageSerializer(context={
+                "request": self.context.get("request"), "image_variant": self.context.get("image_variant"),
+                "fieldset": get_nested_fieldset(self.fieldset, "screenshot"),
+            }).get_by_feedback_id([row["id"] for row in rows])
+            for row, feedback in zip(rows, data):
+                feedback["screenshot"] = screenshots.get(row["id"], [])
+
+
+class CompiledBasicListFeedbackSerializer(CompiledSerializer):
+    """ The compiled BasicListFeedbackSerializer, where the screenshots are their ids. """
+    serializer_class = BasicListFeedbackSerializer
+    nested_fields = ("screenshot",)
+
+    def resolve(self, rows, data):
+        screenshot_ids = {}
+        image_ids = ImageModel.objects.filter(feedbackmodel__in=[row["id"] for row in rows]).values_list("feedbackmodel", "id")
+        for feedback_id, image_id in image_ids:
+            screenshot_ids.setdefault(feedback_id, []).append(str(image_id))
+        for row, feedback in zip(rows, data):
+            feedback["screenshot"] = screenshot_ids.get(row["id"], [])
+
+
 class FeedbackSerializer(serializers.ModelSerializer):
     """
     # HyperlinkedModelSerializer has the following differences from ModelSerializer:
@@ -161,10 +360,8 @@ class FeedbackSerializer(serializers.ModelSerializer):
         validated_data["owner"] = request.user.id
         # validated_data["name_id"] = self.generate_name_id(validated_data.get("name"))
         new_feedback = self.Meta.model.objects.create(**validated_data)
-        screenshot_list: list = list()
-        for each_screenshot in screenshots:
-            screenshot_list.append(ImageModel.objects.create(image=each_screenshot))
-        new_feedback.screenshot.set(screenshot_list)
+        new_feedback.screenshot.add(*ImageModel.objects.create_many(screenshots))
+        invalidate_tags("feedback")
         return validated_data
 
     @transaction.atomic
@@ -177,9 +374,9 @@ class FeedbackSerializer(serializers.ModelSerializer):
         instance.category = validated_data.get("category", instance.category)
         instance.website = validated_data.get("website", instance.website)
         if screenshots := request.FILES.getlist("screenshots"):
-            for each_screenshot in screenshots:
-                instance.screenshot.add(ImageModel.objects.create(image=each_screenshot))
+            instance.screenshot.add(*ImageModel.objects.create_many(screenshots))
             validated_data["screenshots"] = instance.screenshot.all()
         instance.save()
+        invalidate_tags("feedback", f"feedback:{instance.pk}")
         validated_data.update(**self.Meta.model.objects.filter(pk=instance.pk).values()[0])
         return validated_data
@@ -0,0 +1,21 @@
+from feedback_api.celery import APP
+
+
+@APP.task()
+def flush_feedback_counters():
+    from feedback.counters import flush_counters
+
+    """ The periodic task that writes the pending feedback clicks and views to the database. """
+    return flush_counters()
+
+
+@APP.task()
+def process_screenshot(image_id):
+    from feedback.images import create_image_variants
+    from feedback.models import ImageModel
+
+    """ The background task that creates the resized variants of a screenshot. """
+    image_obj = ImageModel.objects.filter(pk=image_id).first()
+    if image_obj is None or not image_obj.image:
+        return {}
+    return create_image_variants(image_obj)
@@ -1,3 +1,540 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import fakeredis
+import jwt
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from timeline.models import TimelineModel
+from user.models import User
+
+from .authentication import (
+    CachedJWTAuthentication, CustomAuthentication, VerifiedTokenCache, verified_profile_tokens, verified_tokens,
+)
+from .counters import RedisCounterStore, flush_counters, get_counter_store
+from .importer import get_copy_value, import_rows
+from .management.commands.import_feedback import Command as ImportFeedbackCommand
+from .models import FeedbackModel, ImageModel, LikesModel
+from .pagination import NinePagination
+from .search import search_feedback
+from .serializers import Base64ImageField
+from .throttles import FeedbackClickThrottle
+
+
+class NinePaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        owner = uuid.uuid4()
+        # Three feedback share each created_at, so every page boundary falls inside a tie.
+        cls.feedback = FeedbackModel.objects.bulk_create([
+            FeedbackModel(owner=owner, title=f"App {index}", created_at=now - timedelta(minutes=index // 3))
+            for index in range(10)
+        ])
+        cls.expected_ids = [
+            obj.id for obj in sorted(cls.feedback, key=lambda obj: (obj.created_at, obj.id), reverse=True)
+        ]
+
+    def paginate(self, url):
+        paginator = NinePagination()
+        paginator.page_size = 4
+        request = Request(APIRequestFactory().get(url))
+        page = paginator.paginate_queryset(FeedbackModel.objects.all(), request)
+        return paginator, [obj.id for obj in page]
+
+    def get_cursor_url(self, link):
+        return "/?" + urlparse(link).query if link else None
+
+    def test_pages_with_tied_created_at_return_every_row_once_in_order(self):
+        seen, url = [], "/"
+        while url:
+            paginator, ids = self.paginate(url)
+            seen.extend(ids)
+            url = self.get_cursor_url(paginator.get_next_link())
+        self.assertEqual(seen, self.expected_ids)
+
+    def test_previous_link_returns_the_previous_page(self):
+        paginator, first_page = self.paginate("/")
+        paginator, second_page = self.paginate(self.get_cursor_url(paginator.get_next_link()))
+        paginator, previous_page = self.paginate(self.get_cursor_url(paginator.get_previous_link()))
+        self.assertEqual(second_page, self.expected_ids[4:8])
+        self.assertEqual(previous_page, first_page)
+
+    def test_malformed_cursor_is_not_found(self):
+        with self.assertRaises(NotFound):
+            self.paginate("/?cursor=not-a-cursor")
+
+    def test_cursor_with_a_bad_position_is_not_found(self):
+        encoder = NinePagination()
+        encoder.base_url = "http://testserver/"
+        for position in ("not-a-date|" + str(uuid.uuid4()), timezone.now().isoformat() + "|not-a-uuid", "no-separator"):
+            link = encoder.encode_cursor(pagination.Cursor(offset=0, reverse=False, position=position))
+            cursor = parse_qs(urlparse(link).query)["cursor"][0]
+            with self.subTest(position=position), self.assertRaises(NotFound):
+                self.paginate(f"/?cursor={cursor}")
+
+
+class LikesToggleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.app = FeedbackModel.objects.create(owner=uuid.uuid4(), title="Liked app")
+        cls.user_id = uuid.uuid4()
+
+    def get_likes_count(self):
+        return FeedbackModel.objects.values_list("likes_count", flat=True).get(pk=self.app.pk)
+
+    def test_toggle_likes_then_unlikes(self):
+        self.assertTrue(LikesModel.objects.toggle(app_id=self.app.pk, user_id=self.user_id))
+        self.assertEqual(self.get_likes_count(), 1)
+        self.assertFalse(LikesModel.objects.toggle(app_id=self.app.pk, user_id=self.user_id))
+        self.assertEqual(self.get_likes_count(), 0)
+        self.assertFalse(LikesModel.objects.filter(app=self.app.pk).exists())
+
+    def test_concurrent_like_is_counted_once(self):
+        # Another request likes the app, and counts its like, after this request found no like to delete,
+        # so this request's insert hits the unique constraint.
+        LikesModel.objects.create(app=self.app.pk, user=self.user_id)
+        FeedbackModel.objects.filter(pk=self.app.pk).update(likes_count=1)
+        with mock.patch("django.db.models.query.QuerySet.delete", return_value=(0, {})):
+            liked = LikesModel.objects.toggle(app_id=self.app.pk, user_id=self.user_id)
+
+        self.assertTrue(liked)
+        self.assertEqual(LikesModel.objects.filter(app=self.app.pk, user=self.user_id).count(), 1)
+        self.assertEqual(self.get_likes_count(), 1)
+
+    def test_duplicate_like_is_rejected_by_the_database(self):
+        LikesModel.objects.create(app=self.app.pk, user=self.user_id)
+        with self.assertRaises(IntegrityError):
+            LikesModel.objects.create(app=self.app.pk, user=self.user_id)
+
+    def test_toggle_of_missing_feedback_writes_nothing(self):
+        with self.assertRaises(FeedbackModel.DoesNotExist):
+            LikesModel.objects.toggle(app_id=uuid.uuid4(), user_id=self.user_id)
+        self.assertFalse(LikesModel.objects.exists())
+
+
+class FeedbackListConditionalTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.feedback = FeedbackModel.objects.bulk_create([
+            FeedbackModel(owner=uuid.uuid4(), title=f"Listed app {index}") for index in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_revalidation_and_cache_hits_make_no_queries(self):
+        etag = self.client.get("/api/v1/feedback/")["ETag"]
+        with self.assertNumQueries(0):
+            not_modified = self.client.get("/api/v1/feedback/", HTTP_IF_NONE_MATCH=etag)
+            cached = self.client.get("/api/v1/feedback/")
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(cached["X-Cache"], "HIT")
+        self.assertEqual(cached["ETag"], etag)
+
+    def test_deleting_a_feedback_changes_the_etag(self):
+        etag = self.client.get("/api/v1/feedback/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/v1/feedback/{self.feedback[0].pk}/")
+        response = self.client.get("/api/v1/feedback/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+
+class FeedbackDetailConditionalTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.app = FeedbackModel.objects.create(owner=uuid.uuid4(), title="Viewed app")
+
+    def setUp(self):
+        cache.clear()
+        get_counter_store().take("views")
+
+    def test_counting_views_keeps_the_etag(self):
+        url = f"/api/v1/feedback/{self.app.pk}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(flush_counters()["views"], 1)
+        self.assertEqual(FeedbackModel.objects.values_list("views", flat=True).get(pk=self.app.pk), 2)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class FeedbackExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin@example.com", password="admin-password")
+        cls.owner = User.objects.create_user("owner@example.com", password="owner-password", phone_no="0800")
+        FeedbackModel.objects.create(owner=cls.owner.id, title="Exported app")
+
+    def get_token(self, email, password):
+        return self.client.post("/api/v1/token/", {"email": email, "password": password}).json()["access"]
+
+    def export(self, token=None, query=""):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        response = self.client.get(f"/api/v1/feedback/export/{query}", **headers)
+        if response.status_code != 200:
+            return response, None
+        return response, [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_anonymous_export_is_refused(self):
+        response, _ = self.export()
+        self.assertEqual(response.status_code, 401)
+
+    def test_export_by_a_non_admin_is_forbidden(self):
+        response, _ = self.export(self.get_token("owner@example.com", "owner-password"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_by_a_demoted_or_deactivated_admin_is_refused(self):
+        token = self.get_token("admin@example.com", "admin-password")
+        User.objects.filter(pk=self.admin.pk).update(is_admin=False)
+        response, _ = self.export(token)
+        self.assertEqual(response.status_code, 403)
+
+        User.objects.filter(pk=self.admin.pk).update(is_admin=True, is_active=False)
+        response, _ = self.export(token)
+        self.assertEqual(response.status_code, 401)
+
+    def test_export_leaves_out_the_owner_contact_fields(self):
+        response, rows = self.export(self.get_token("admin@example.com", "admin-password"))
+        self.assertEqual(response.status_code, 200)
+        owner = rows[0]["owner"]
+        self.assertEqual(owner["id"], str(self.owner.id))
+        for field in ("email", "phone_no", "address", "date_joined"):
+            self.assertNotIn(field, owner)
+
+    def test_export_includes_the_owner_contact_fields_it_names(self):
+        token = self.get_token("admin@example.com", "admin-password")
+        _, rows = self.export(token, "?fields=title,owner.email")
+        self.assertEqual(rows, [{"title": "Exported app", "owner": {"email": "owner@example.com"}}])
+
+
+class VerifiedTokenCacheTests(TestCase):
+
+    def setUp(self):
+        verified_tokens.clear()
+        verified_profile_tokens.clear()
+        self.user_id = uuid.uuid4()
+
+    def get_raw_token(self):
+        token = AccessToken()
+        token["user_id"] = str(self.user_id)
+        return str(token).encode()
+
+    def test_cached_token_past_its_expiry_is_rejected(self):
+        raw_token = self.get_raw_token()
+        authentication = CachedJWTAuthentication()
+        validated_token = authentication.get_validated_token(raw_token)
+        self.assertIs(verified_tokens.get(raw_token), validated_token)
+
+        expired_at = validated_token["exp"] + 1
+        with mock.patch("feedback.authentication.time.time", return_value=expired_at), \
+                mock.patch(
+                    "rest_framework_simplejwt.tokens.aware_utcnow",
+                    return_value=datetime.fromtimestamp(expired_at, tz=dt_timezone.utc),
+                ):
+            self.assertIsNone(verified_tokens.get(raw_token))
+            with self.assertRaises(InvalidToken):
+                authentication.get_validated_token(raw_token)
+
+    def test_least_recently_used_token_is_evicted(self):
+        tokens = VerifiedTokenCache(maxsize=2)
+        expires_at = time.time() + 60
+        tokens.set("first", "first token", expires_at)
+        tokens.set("second", "second token", expires_at)
+        tokens.get("first")
+        tokens.set("third", "third token", expires_at)
+        self.assertEqual(tokens.get("first"), "first token")
+        self.assertIsNone(tokens.get("second"))
+        self.assertEqual(tokens.get("third"), "third token")
+
+    def test_token_without_expiry_is_not_cached(self):
+        raw_token = jwt.encode({"user_id": str(self.user_id)}, "profile-secret", algorithm="HS256").encode()
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=b"Bearer " + raw_token)
+        with mock.patch("feedback.authentication.AUTH_SECRET_KEY", "profile-secret"):
+            self.assertEqual(CustomAuthentication.decode_jwt_token(request), {"user_id": str(self.user_id)})
+        self.assertIsNone(verified_profile_tokens.get(raw_token))
+
+    def test_authenticated_list_makes_no_user_queries(self):
+        cache.clear()
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {self.get_raw_token().decode()}"}
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(2):
+                self.assertEqual(self.client.get("/api/v1/timeline/", **headers).status_code, 200)
+        self.assertFalse([query for query in queries if User._meta.db_table in query["sql"]])
+        self.assertEqual(self.client.get("/api/v1/timeline/", HTTP_AUTHORIZATION="Bearer not-a-token").status_code, 401)
+
+
+class FeedbackClickTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.app = FeedbackModel.objects.create(owner=uuid.uuid4(), title="Clicked app")
+
+    def setUp(self):
+        # The throttle history and the pending counts are kept in the cache and the process between tests.
+        cache.clear()
+        get_counter_store().take("clicks")
+
+    def click(self, pk):
+        return self.client.post(f"/api/v1/feedback/{pk}/click/")
+
+    def test_click_is_recorded(self):
+        self.assertEqual(self.click(self.app.pk).status_code, 202)
+        self.assertEqual(get_counter_store().take("clicks")[1], {str(self.app.pk): 1})
+
+    def test_click_on_missing_feedback_is_not_recorded(self):
+        self.assertEqual(self.click(uuid.uuid4()).status_code, 404)
+        self.assertEqual(self.click("not-a-uuid").status_code, 404)
+        self.assertEqual(get_counter_store().take("clicks")[1], {})
+
+    def test_clicks_are_throttled(self):
+        with mock.patch.dict(FeedbackClickThrottle.THROTTLE_RATES, {"feedback_click": "2/minute"}):
+            statuses = [self.click(self.app.pk).status_code for _ in range(3)]
+        self.assertEqual(statuses, [202, 202, 429])
+
+
+
+class RedisCounterFlushTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.app = FeedbackModel.objects.create(owner=uuid.uuid4(), title="Counted app")
+
+    def setUp(self):
+        with mock.patch("django_redis.get_redis_connection", return_value=fakeredis.FakeRedis()):
+            self.store = RedisCounterStore("default")
+        patcher = mock.patch("feedback.counters._store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_clicks(self):
+        return FeedbackModel.objects.values_list("clicks", flat=True).get(pk=self.app.pk)
+
+    def test_counts_recorded_during_a_flush_wait_for_the_next(self):
+        self.store.add("clicks", str(self.app.pk), 2)
+        flush_id, counts = self.store.take("clicks")
+        self.store.add("clicks", str(self.app.pk))
+        self.assertEqual(counts, {str(self.app.pk): 2})
+        self.assertEqual(self.store.take("clicks"), (flush_id, counts))
+        self.store.done("clicks")
+        self.assertEqual(self.store.take("clicks")[1], {str(self.app.pk): 1})
+
+    def test_flush_is_skipped_while_another_holds_the_lock(self):
+        self.store.add("clicks", str(self.app.pk), 3)
+        with self.store.flush_lock() as acquired:
+            self.assertTrue(acquired)
+            self.assertEqual(flush_counters(), {})
+        self.assertIsNone(self.get_clicks())
+        self.assertEqual(flush_counters(), {"clicks": 1, "views": 0})
+        self.assertEqual(self.get_clicks(), 3)
+
+    def test_flush_retried_after_a_failure_is_applied_once(self):
+        self.store.add("clicks", str(self.app.pk), 3)
+        with mock.patch.object(self.store, "done", side_effect=ConnectionError), self.assertRaises(ConnectionError):
+            flush_counters()
+        self.assertEqual(self.get_clicks(), 3)
+
+        self.assertEqual(flush_counters(), {"clicks": 0, "views": 0})
+        self.assertEqual(self.get_clicks(), 3)
+        self.assertEqual(self.store.take("clicks"), (None, {}))
+        # The lock was released by the failed flush.
+        self.store.add("clicks", str(self.app.pk))
+        self.assertEqual(flush_counters(), {"clicks": 1, "views": 0})
+        self.assertEqual(self.get_clicks(), 4)
+
+
+@skipUnless(connection.vendor == "sqlite", "The FTS5 index is only used on SQLite")
+class SQLiteSearchIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = uuid.uuid4()
+        cls.alpha = FeedbackModel.objects.create(owner=owner, title="Alpha notes")
+        cls.bravo = FeedbackModel.objects.create(owner=owner, title="Bravo tasks")
+
+    def search(self, term):
+        return list(search_feedback(FeedbackModel.objects.all(), term).values_list("title", flat=True))
+
+    def test_index_follows_updates_and_deletes(self):
+        self.alpha.title = "Charlie notes"
+        self.alpha.save()
+        self.bravo.delete()
+        self.assertEqual(self.search("alpha"), [])
+        self.assertEqual(self.search("charlie"), ["Charlie notes"])
+        self.assertEqual(self.search("bravo"), [])
+
+    def test_index_survives_renumbered_rowids(self):
+        # VACUUM may renumber the implicit rowids of the feedback table, whose primary key is a UUID.
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {FeedbackModel._meta.db_table} SET rowid = rowid + 100")
+        self.assertEqual(self.search("alpha"), ["Alpha notes"])
+        self.assertEqual(self.search("bravo"), ["Bravo tasks"])
+
+
+class Base64ImageFieldTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        image_file = BytesIO()
+        Image.new("RGB", (40, 30), "red").save(image_file, format="PNG")
+        cls.image = image_file.getvalue()
+        cls.encoded = base64.b64encode(cls.image).decode()
+
+    def decode(self, data, **kwargs):
+        field = Base64ImageField(**kwargs)
+        # Small chunks, so the test images are decoded over many of them.
+        field.chunk_size = 16
+        return field.to_internal_value(data)
+
+    def assertDecodes(self, data):
+        decoded = self.decode(data)
+        self.assertTrue(decoded.name.endswith(".png"))
+        self.assertEqual(decoded.content_type, "image/png")
+        decoded.seek(0)
+        self.assertEqual(decoded.read(), self.image)
+        return decoded
+
+    def test_plain_and_data_uri_input(self):
+        self.assertDecodes(self.encoded)
+        self.assertDecodes(f"data:image/png;base64,{self.encoded}")
+
+    def test_whitespace_wrapped_input(self):
+        self.assertDecodes(base64.encodebytes(self.image).decode())
+        self.assertDecodes(" ".join(self.encoded[index:index + 7] for index in range(0, len(self.encoded), 7)))
+
+    def test_oversized_input_is_rejected_before_decoding(self):
+        with mock.patch.object(Base64ImageField, "decode_chunks") as decode_chunks:
+            with self.assertRaisesMessage(ValidationError, "at most 10 bytes"):
+                self.decode(self.encoded, max_decoded_size=10)
+        decode_chunks.assert_not_called()
+
+    def test_invalid_base64_is_rejected(self):
+        for data in ("not base64!", self.encoded[:-1], "data:image/png,abcd", ""):
+            with self.subTest(data=data[:20]), self.assertRaises(ValidationError):
+                self.decode(data)
+
+    def test_non_image_payload_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.decode(base64.b64encode(b"Not an image, only some text.").decode())
+
+    def test_large_input_is_decoded_to_a_temporary_file(self):
+        self.assertIsInstance(self.assertDecodes(self.encoded), InMemoryUploadedFile)
+        with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=len(self.image) // 2):
+            decoded = self.assertDecodes(self.encoded)
+        self.assertIsInstance(decoded, TemporaryUploadedFile)
+        decoded.close()
+
+
+class ImportFeedbackCommandTests(TestCase):
+
+    def setUp(self):
+        self.owner = uuid.uuid4()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "feedback.jsonl")
+
+    def write_lines(self, *lines):
+        with open(self.path, "w") as file:
+            file.write("".join(f"{line}\n" for line in lines))
+
+    def get_line(self, index: int) -> str:
+        return json.dumps({"owner": str(self.owner), "title": f"Imported app {index}", "screenshot": [f"images/{index}.png"]})
+
+    def import_feedback(self, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("import_feedback", self.path, "--batch-size=2", "--skip-variants", *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def assertImportedOnce(self, count: int):
+        self.assertEqual(FeedbackModel.objects.count(), count)
+        self.assertEqual(ImageModel.objects.count(), count)
+        self.assertEqual(FeedbackModel.screenshot.through.objects.count(), count)
+        self.assertEqual(TimelineModel.objects.filter(category="LIST_APP").count(), count)
+
+    def test_rerun_after_a_batch_committed_without_its_checkpoint_imports_nothing_twice(self):
+        self.write_lines(*[self.get_line(index) for index in range(5)])
+        with mock.patch.object(ImportFeedbackCommand, "write_checkpoint", side_effect=OSError("Disk full")):
+            with self.assertRaises(OSError):
+                self.import_feedback()
+        self.assertImportedOnce(2)
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+        stdout, _ = self.import_feedback()
+        self.assertImportedOnce(5)
+        self.assertIn("3 feedback imported, 2 already imported, 0 rejected", stdout)
+
+        stdout, _ = self.import_feedback("--restart")
+        self.assertImportedOnce(5)
+        self.assertIn("0 feedback imported, 5 already imported", stdout)
+
+    def test_interrupted_import_resumes_from_its_checkpoint(self):
+        self.write_lines(*[self.get_line(index) for index in range(5)])
+        calls = []
+
+        def import_one_batch(*args, **kwargs):
+            calls.append(args)
+            if len(calls) > 1:
+                raise RuntimeError("Connection lost")
+            return import_rows(*args, **kwargs)
+
+        with mock.patch("feedback.importer.import_rows", side_effect=import_one_batch):
+            with self.assertRaises(RuntimeError):
+                self.import_feedback()
+        self.assertTrue(os.path.exists(f"{self.path}.checkpoint"))
+
+        stdout, _ = self.import_feedback()
+        self.assertIn("Resuming after line 2.", stdout)
+        self.assertIn("3 feedback imported, 0 already imported", stdout)
+        self.assertImportedOnce(5)
+
+    def test_rejected_lines_are_reported_with_their_line_numbers(self):
+        self.write_lines(self.get_line(0), "{not json", "", json.dumps({"title": "No owner"}), self.get_line(1))
+        stdout, stderr = self.import_feedback()
+        self.assertIn("Line 2: Invalid JSON", stderr)
+        self.assertIn("Line 4: {'owner'", stderr)
+        self.assertNotIn("Line 3", stderr)
+        self.assertIn("2 feedback imported, 0 already imported, 2 rejected", stdout)
+        self.assertImportedOnce(2)
+
+
+class CopyValueTests(SimpleTestCase):
+
+    def get_copy_value(self, field_name: str, value) -> str:
+        feedback = FeedbackModel(**{field_name: value})
+        return get_copy_value(FeedbackModel._meta.get_field(field_name), feedback, connection)
+
+    def test_special_characters_are_escaped(self):
+        self.assertEqual(self.get_copy_value("title", "tab\there\nnew\\back\rreturn"), "tab\\there\\nnew\\\\back\\rreturn")
+
+    def test_null_is_written_as_backslash_n(self):
+        self.assertEqual(self.get_copy_value("title", None), "\\N")
+        self.assertEqual(self.get_copy_value("title", "\\N"), "\\\\N")
@@ -0,0 +1,6 @@
+from rest_framework.throttling import AnonRateThrottle
+
+
+class FeedbackClickThrottle(AnonRateThrottle):
+    """ Limits the clicks counted per client IP, at the "feedback_click" rate of DEFAULT_THROTTLE_RATES. """
+    scope = "feedback_click"
@@ -2,7 +2,7 @@
 from django.urls import path, include
 from rest_framework import routers
 
-from feedback.views import FeedbackView
+from feedback.views import FeedbackView, category_list, social_list
 
 # restframework imports
 # from rest_framework.urlpatterns import format_suffix_patterns
@@ -17,5 +17,8 @@ router.register(r"", FeedbackView)
 # router.register(r"version", VersionView, basename="version")
 
 urlpatterns = [
+    # Served without DRF, ahead of the router so they are not taken for a feedback id.
+    path("social_list/", social_list, name="social-list"),
+    path("category_list/", category_list, name="category-list"),
     path("", include(router.urls))
 ]
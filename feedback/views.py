@@ -1,53 +1,124 @@
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from django.db.models import Q
-from django.shortcuts import get_list_or_404
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from shared.cache import cache_response, conditional_response, get_tag_versions, invalidate_tags
+from shared.compiled import CompiledListMixin
+from shared.fieldsets import FieldsetViewMixin
+from .authentication import CachedJWTAuthentication
+from .counters import record_click, record_view
 from .enums import APPLE_APPS_CATEGORY
-from .filters import FeedbackFilters
-from .models import FeedbackModel, ImageModel, TimelineModel
+from .export import EXPORT_FORMATS, export_feedback
+from .filters import FeedbackFilters, FeedbackSearchFilter
+from .models import FeedbackModel, ImageModel, LikesModel, TimelineModel
 from .pagination import NinePagination
 from .permissions import IsAppCreatorOrReadOnly
+from .search import search_feedback
 from .serializers import (
+    CompiledListFeedbackSerializer,
     FeedbackSerializer,
     FeedbackSearchSerializer,
     ListFeedbackSerializer,
-    FeedbackImageSerializer
+    FeedbackImageSerializer,
+    LikedFeedbackSerializer
 )
+from .throttles import FeedbackClickThrottle
 from .enums import SOCIAL_ACCOUNT_CHOICES
 
 
-class SearchView(viewsets.ModelViewSet):
+class SearchView(viewsets.ReadOnlyModelViewSet):
     queryset = FeedbackModel.objects.all()
-    serializer_class = FeedbackSearchSerializer
+    serializer_class = ListFeedbackSerializer
 
     def get_queryset(self):
-        return FeedbackModel.objects.all()
+        serializer = FeedbackSearchSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return search_feedback(
+            FeedbackModel.objects.with_screenshots(), serializer.validated_data["q"]
+        ).order_by("-rank", "-created_at")
 
 
-class FeedbackView(viewsets.ModelViewSet):
+class FeedbackView(FieldsetViewMixin, CompiledListMixin, viewsets.ModelViewSet):
     queryset = FeedbackModel.objects.all()
     serializer_class = ListFeedbackSerializer
+    compiled_serializer_class = CompiledListFeedbackSerializer
     # authentication_classes = [JWTAuthentication]
     authentication_classes = []
     permission_classes = []
-    # pagination_class = NinePagination
+    pagination_class = NinePagination
+    fieldset_actions = ("list", "retrieve", "export")
     filterset_class = FeedbackFilters
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FeedbackSearchFilter, filters.OrderingFilter]
     http_method_names = ["get", "post", "patch", "put", "delete"]
     # parser_classes = []
     # lookup_field = 'name_id'
     # lookup_url_kwarg = 'name'
-    search_fields = ['description', 'long_description']
     # ordering_fields = ['name']
 
+    def get_queryset(self):
+        # created_at and id are the pagination keys, so they are read whatever fields are selected.
+        return self.prune_queryset(
+            FeedbackModel.objects.for_fieldset(self.get_fieldset()), keep=("id", "created_at")
+        )
+
+    @conditional_response("get_list_validators")
+    @cache_response(tags=("feedback",))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self.cached_retrieve(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            record_view(kwargs["pk"])
+        return response
+
+    @conditional_response("get_object_validators")
+    @cache_response(tags=("feedback:{pk}",))
+    def cached_retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_list_validators(self, request, **kwargs):
+        """
+        A list changes whenever a feedback is added, edited or removed, which invalidates the "feedback" tag, so the
+        tag version validates it without a query. Likes, clicks and views do not invalidate the tag, so the version
+        also rolls over every RESPONSE_CACHE_TIMEOUT, which is as long as they may lag on a cached list anyway.
+        """
+        tag_version, = get_tag_versions(caches[settings.RESPONSE_CACHE_ALIAS], ["feedback"])
+        period = settings.RESPONSE_CACHE_TIMEOUT
+        period_start = int(time.time()) // period * period
+        last_modified = datetime.fromtimestamp(max(tag_version / 1e9, period_start), tz=dt_timezone.utc)
+        return (tag_version, period_start), last_modified
+
+    def get_object_validators(self, request, pk=None, **kwargs):
+        """
+        Validate a feedback by its updated_at. The flushes of the clicks and views counters leave updated_at
+        alone, so the counts of a feedback may lag until it is next edited or its cached response expires.
+        """
+        try:
+            updated_at = FeedbackModel.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+        except DjangoValidationError:
+            return None
+        return None if updated_at is None else (updated_at, updated_at)
+
     def get_object(self):
         obj = super().get_object()
         return obj
@@ -70,8 +141,6 @@ class FeedbackView(viewsets.ModelViewSet):
             if self.request.POST:
                 print("INside write requests")
                 # authentication_classes = [JWTAuthentication]
-            if self.request.GET:
-                authentication_classes = []
         except:
             pass
         return [authenticator() for authenticator in authentication_classes]
@@ -82,6 +151,10 @@ class FeedbackView(viewsets.ModelViewSet):
         # approver_list = get_users_by_id(self.request, formatted_uuids)
         # default_context['approver_list'] = approver_list
         default_context['request'] = self.request
+        # Lists show thumbnails and the detail page shows the large variant, unless ?image_size= asks otherwise.
+        default_context['image_variant'] = self.request.query_params.get(
+            "image_size", "large" if self.action == "retrieve" else "thumbnail"
+        )
         return default_context
 
     # def update(self, request, *args, **kwargs):
@@ -96,6 +169,8 @@ class FeedbackView(viewsets.ModelViewSet):
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
+        invalidate_tags("feedback", f"feedback:{instance.pk}")
+        LikesModel.objects.filter(app=instance.pk).delete()
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -109,68 +184,124 @@ class FeedbackView(viewsets.ModelViewSet):
     )
     @action(methods=["GET"], detail=False, url_path="exists")
     def name_exists(self, request):
-        """ Endpoint that returns if an app name exist """
-        app_name: str = request.query_params.get("name", "")
-        if app_name:
-            app_name = app_name.strip().lower()
-        exists = self.queryset.filter(name__iexact=app_name).exists()
+        """ Endpoint that returns if a feedback title exist """
+        app_name: str = request.query_params.get("name", "").strip()
+        exists = bool(app_name) and FeedbackModel.objects.title_exists(app_name)
         return Response(data={"exists": exists}, status=status.HTTP_200_OK)
 
-
-    # @action(methods=["GET", "POST"], detail=False, url_path="search", permission_classes=[],
-    #         serializer_class=AppsSearchSerializer)
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("q", OpenApiTypes.STR, OpenApiParameter.QUERY, required=True),
+            OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY, required=False),
+        ],
+        methods=["GET"]
+    )
+    @action(methods=["GET"], detail=False, url_path="search", serializer_class=FeedbackSearchSerializer)
     def search_apps(self, request, pk=None):
-        app_obj = FeedbackModel.objects.all()
-        serializer = self.serializer_class(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        app_name = serializer.validated_data.get('app_name')
-        print(f"APP NAME FROM SERIALIZER VALIDATED DATA is: {app_name}")
-
-        if request.method == "GET":
-            app_search_obj = get_list_or_404(app_obj, **serializer.validated_data)
-            app_serializer = self.serializer_class(app_search_obj, many=True, data=request.data)
-            return Response(app_serializer.data)
-        elif request.method == "POST":
-            app_search_obj = FeedbackModel.objects.filter(
-                Q(app_name__icontains=app_name)
-                | Q(app_owner__username__icontains=app_name)
-            )
-            app_search_serializer = self.serializer_class(app_search_obj, many=True, data=request.data)
-            app_search_serializer.is_valid(raise_exception=True)
-            search_serializer = FeedbackSerializer(app_search_obj, many=True)
-            return Response(search_serializer.data)
-
-        # search_query_params = request.query_params
-        # print(f"SEARCH QUERY PARAMS: {search_query_params}")
-        # print(f"SEARCH QUERY PARAMS: {serializer.validated_data}")
-        # # Instead of using request.query_params, use serializer.validated_data.
-        #
-        # if request.method == "GET":
-        #     query_dict = {}
-        #     for each_search_key, each_search_value in search_query_params.items():
-        #         query_dict[each_search_key] = each_search_value
-        #     print(f"SEARCH QUERY IS: {search_query_params}")
-        #     print(f"SEARCH QUERY CUSTOM DICT IS: {query_dict}")
-        #     app_search_obj = get_object_or_404(app_obj, **query_dict)
-        #     print(app_search_obj)
-        #     app_serializer = self.serializer_class(app_search_obj)
-        #     return Response(app_serializer.data)
-        # elif request.method == "POST":
-        #     app_name_query = request.data.get("app_name")
-        #     # print(f"App Name Search String: {app_name_query}")
-        #     # print(f"Request params: {dir(request)}")
-        #     search_filter_obj = AppsModel.objects.filter(Q(app_name__icontains=app_name_query) |
-        #                                                  Q(app_owner__username__icontains=app_name_query))
-        #     print(f"SEARCH FILTER OBJ: {search_filter_obj}")
-        #     # search_result_serializer = AppsSearchSerializer()
-        #     search_result_serializer = AppsSerializer(
-        #         search_filter_obj, many=True, data=request.data
-        #     )
-        #     if search_result_serializer.is_valid():
-        #         return Response(
-        #             search_result_serializer.data
-        #         )
-        #     return Response(search_result_serializer.errors)
+        """ Endpoint that returns the feedback best matching a search term, ranked by relevance """
+        serializer = self.serializer_class(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        search_obj = search_feedback(self.get_queryset(), serializer.validated_data["q"]).order_by(
+            "-rank", "-created_at"
+        )[:serializer.validated_data["limit"]]
+        search_serializer = ListFeedbackSerializer(search_obj, many=True, context=self.get_serializer_context())
+        return Response(data=search_serializer.data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "export_format", OpenApiTypes.STR, OpenApiParameter.QUERY, required=False, enum=tuple(EXPORT_FORMATS),
+                description="ndjson (default) or csv, which is gzipped"
+            ),
+        ],
+        methods=["GET"]
+    )
+    @action(
+        methods=["GET"], detail=False, url_path="export", authentication_classes=[JWTAuthentication],
+        permission_classes=[permissions.IsAdminUser]
+    )
+    def export(self, request):
+        """
+        Endpoint for admins that streams every feedback matching the list filters, as NDJSON or gzipped CSV.
+        The user of the token is read from the database, so an admin who is demoted or deactivated is refused at once.
+        The rows are read and serialized a chunk at a time, so the export is not paginated.
+        The owner's contact fields are left out unless ?fields= names them, like ?fields=id,title,owner.email.
+        """
+        export_format = request.query_params.get("export_format", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            return Response(data={"success": False}, status=status.HTTP_400_BAD_REQUEST)
+        content_type, extension = EXPORT_FORMATS[export_format]
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            export_feedback(queryset, export_format, settings.FEEDBACK_EXPORT_CHUNK_SIZE, self.get_serializer_context()),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="feedback-{timezone.now():%Y%m%d%H%M%S}.{extension}"'
+        return response
+
+    @action(methods=["POST"], detail=True, url_path="click", throttle_classes=[FeedbackClickThrottle])
+    def click(self, request, pk=None):
+        """
+        Endpoint to count a click on a feedback.
+        The click is buffered and written to the database by the flush_feedback_counters task.
+        """
+        try:
+            uuid.UUID(str(pk))
+        except ValueError:
+            return Response(data={"success": False}, status=status.HTTP_404_NOT_FOUND)
+        # Only existing feedback are counted, so made up ids cannot grow the pending counters.
+        if not FeedbackModel.objects.filter(pk=pk).exists():
+            return Response(data={"success": False}, status=status.HTTP_404_NOT_FOUND)
+        record_click(pk)
+        return Response(data={"success": True}, status=status.HTTP_202_ACCEPTED)
+
+    @action(
+        methods=["GET", "POST"], detail=True, url_path="like", authentication_classes=[CachedJWTAuthentication],
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def like(self, request, pk=None):
+        """
+        Endpoint to get or toggle the current user's like of a feedback.
+        GET returns the like status, POST likes the feedback or removes the like.
+        """
+        if request.method == "POST":
+            try:
+                liked = LikesModel.objects.toggle(app_id=pk, user_id=request.user.id)
+            except (FeedbackModel.DoesNotExist, DjangoValidationError):
+                return Response(data={"success": False}, status=status.HTTP_404_NOT_FOUND)
+            invalidate_tags(f"feedback:{pk}")
+        else:
+            try:
+                liked = LikesModel.objects.is_liked(app_id=pk, user_id=request.user.id)
+            except DjangoValidationError:
+                return Response(data={"success": False}, status=status.HTTP_404_NOT_FOUND)
+        likes_count = FeedbackModel.objects.filter(pk=pk).values_list("likes_count", flat=True).first()
+        if likes_count is None:
+            return Response(data={"success": False}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data={"liked": liked, "likes_count": likes_count}, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "ids", OpenApiTypes.STR, OpenApiParameter.QUERY, required=True,
+                description="Comma separated feedback ids, at most 100"
+            ),
+        ],
+        methods=["GET"]
+    )
+    @action(
+        methods=["GET"], detail=False, url_path="liked", authentication_classes=[CachedJWTAuthentication],
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def liked(self, request):
+        """ Endpoint that returns which of a page of feedback the current user has liked, in one query """
+        ids = [each_id for each_id in request.query_params.get("ids", "").split(",") if each_id]
+        serializer = LikedFeedbackSerializer(data={"ids": ids})
+        if not serializer.is_valid():
+            return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        liked_ids = LikesModel.objects.liked_app_ids(request.user.id, serializer.validated_data["ids"])
+        return Response(data={"liked": [str(liked_id) for liked_id in liked_ids]}, status=status.HTTP_200_OK)
 
     @action(methods=["GET"], detail=False, url_path="latest", serializer_class=FeedbackSerializer, authentication_classes=[])
     def latest_apps(self, request, pk=None):
@@ -179,16 +310,6 @@ class FeedbackView(viewsets.ModelViewSet):
         # app_serializer.is_valid(raise_exception=True)
         return Response(app_serializer.data)
 
-    @action(methods=["GET"], detail=False, url_path="social_list")
-    def social_list(self, request):
-        """ The endpoint to list the social sites available on Nine. """
-        return Response(dict(SOCIAL_ACCOUNT_CHOICES).values(), status=status.HTTP_200_OK)
-
-    @action(methods=["GET"], detail=False, url_path="category_list")
-    def category_list(self, request):
-        """ The endpoint to list the category sites available on Nine. """
-        return Response(dict(APPLE_APPS_CATEGORY).values(), status=status.HTTP_200_OK)
-
     @action(methods=["GET"], detail=False, url_path=r"screenshot/(?P<id>[^/.]+)")
     def get_screenshot(self, request, id):
         """
@@ -219,6 +340,7 @@ class FeedbackView(viewsets.ModelViewSet):
         if not serializer.is_valid():
             return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         serializer.save()
+        FeedbackModel.objects.screenshots_changed([id])
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
     @action(methods=["DELETE"], detail=False, url_path=r"screenshot/(?P<id>[^/.]+)/delete")
@@ -232,5 +354,34 @@ class FeedbackView(viewsets.ModelViewSet):
         image_obj = ImageModel.objects.filter(pk=id)
         if not image_obj.exists():
             return Response(data={"success": False}, status=status.HTTP_404_NOT_FOUND)
+        FeedbackModel.objects.screenshots_changed([id])
         image_obj.delete()
         return Response(data={"success": True}, status=status.HTTP_200_OK)
+
+
+def static_json_view(data):
+    """
+    Build a view that serves data which only changes on deploy, such as the lists in feedback.enums.
+    The data is rendered once, here, and served with a content hash ETag and a long-lived Cache-Control,
+    so a request either gets the pre-rendered bytes or a 304 Not Modified, without going through DRF.
+    :param data: The JSON serializable data
+    :return: The view function
+    """
+    content = JSONRenderer().render(data)
+    etag = quote_etag(hashlib.sha256(content).hexdigest()[:32])
+    cache_control = f"public, max-age={settings.STATIC_JSON_MAX_AGE}"
+
+    @require_safe
+    def view(request):
+        response = HttpResponse(content, content_type="application/json")
+        response["ETag"] = etag
+        response["Cache-Control"] = cache_control
+        return get_conditional_response(request, etag=etag, response=response)
+
+    return view
+
+
+# The endpoint to list the social sites available on Nine.
+social_list = static_json_view(list(dict(SOCIAL_ACCOUNT_CHOICES).values()))
+# The endpoint to list the category sites available on Nine.
+category_list = static_json_view(list(dict(APPLE_APPS_CATEGORY).values()))
@@ -0,0 +1,47 @@
+"""
+Settings for `manage.py benchmark`.
+
+The production settings with SQLite, local file storage and a local memory cache standing in for
+PostgreSQL, S3 and Redis, and an in-memory Celery broker so queued tasks never leave the process.
+Run with DJANGO_SETTINGS_MODULE=feedback_api.benchmark_settings.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from .settings import *  # noqa: E402,F401,F403
+
+# Refuses to run `manage.py benchmark` against any other settings, as the benchmark flushes the database.
+BENCHMARK = True
+BENCHMARK_DIR = os.getenv("BENCHMARK_DIR", os.path.join(tempfile.gettempdir(), "feedback-benchmark"))
+
+DEBUG = False
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BENCHMARK_DIR, "db.sqlite3"),
+    }
+}
+# The apps ship no migrations, so their tables are created with migrate --run-syncdb.
+MIGRATION_MODULES = {"user": None, "feedback": None, "timeline": None}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "benchmark",
+    }
+}
+DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
+MEDIA_ROOT = os.path.join(BENCHMARK_DIR, "media")
+MEDIA_URL = "/media/"
+
+# Profiled requests would be slower than the rest.
+REQUEST_PROFILING_SAMPLE_RATE = 0
+
+CELERY_BROKER_URL = "memory://"
+CELERY_RESULT_BACKEND = "cache+memory://"
+
+# The debug toolbar would be measured with every request.
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != "debug_toolbar"]  # noqa: F405
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if "debug_toolbar" not in middleware]  # noqa: F405
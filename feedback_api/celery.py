@@ -23,5 +23,9 @@ class CeleryConfig(AppConfig):
         installed_apps = [app_config.name for app_config in apps.get_app_configs()]
         APP.autodiscover_tasks(installed_apps, force=True)
 
+        from shared.metrics import connect_signals
+
+        connect_signals()
+
     # def tearDown(self):
     #     get_redis_connection("default").flushall()
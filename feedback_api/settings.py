@@ -72,6 +72,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "debug_toolbar.middleware.DebugToolbarMiddleware",
+    "shared.metrics.MetricsMiddleware",
+    "shared.profiling.RequestProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -215,6 +217,10 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     # "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.CursorPagination",
     "PAGE_SIZE": 20,
+    # The rates of the throttle scopes of the anonymous write endpoints, per client IP.
+    "DEFAULT_THROTTLE_RATES": {
+        "feedback_click": "30/minute",
+    },
     # "ORDERING":
     # 'DEFAULT_FILTER_BACKENDS': (
     #     'django_filters.rest_framework.DjangoFilterBackend',
@@ -246,7 +252,8 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=90),
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": False,
-    "UPDATE_LAST_LOGIN": True,
+    # The login time is recorded by CustomTokenObtainPairSerializer through user.activity instead.
+    "UPDATE_LAST_LOGIN": False,
     "ALGORITHM": "HS256",
     "SIGNING_KEY": SECRET_KEY,
     "AUTH_HEADER_TYPES": ("Bearer",),
@@ -271,6 +278,10 @@ SIMPLE_JWT = {
     # 'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# The number of verified access tokens each process keeps, so repeat requests skip the signature check
+# (feedback.authentication.CachedJWTAuthentication).
+JWT_VERIFIED_TOKEN_CACHE_SIZE = 1024
+
 SWAGGER_SETTINGS = {
     "SECURITY_DEFINITIONS": {
         "Bearer": {"type": "apiKey", "name": "Authorization", "in": "header"}
@@ -348,11 +359,48 @@ CELERY_TASK_SERIALIZER = "json"
 
 CELERY_TIMEZONE = TIME_ZONE
 
+# FEEDBACK CLICKS AND VIEWS COUNTERS (feedback.counters)
+# Counts are buffered in this cache and written to the database every flush interval.
+FEEDBACK_COUNTER_CACHE_ALIAS = "default"
+FEEDBACK_COUNTER_FLUSH_INTERVAL = 60  # seconds
+# USER LOGIN TIMES (user.activity)
+# Login times are buffered in this cache and written to the database every flush interval.
+USER_ACTIVITY_CACHE_ALIAS = "default"
+USER_ACTIVITY_FLUSH_INTERVAL = 60  # seconds
+# TIMELINE EVENTS (timeline.managers)
+# Every commit that records an event queues a drain. This periodic drain catches the events whose drain was lost.
+TIMELINE_OUTBOX_DRAIN_INTERVAL = 30  # seconds
+# The per-user timeline feeds (timeline.feed) are kept in this cache, newest TIMELINE_FEED_SIZE events each.
+TIMELINE_FEED_CACHE_ALIAS = "default"
+TIMELINE_FEED_SIZE = 200
+TIMELINE_FEED_TTL = 60 * 60 * 24 * 7  # seconds
+CELERY_BEAT_SCHEDULE = {
+    "flush-feedback-counters": {
+        "task": "feedback.tasks.flush_feedback_counters",
+        "schedule": FEEDBACK_COUNTER_FLUSH_INTERVAL,
+    },
+    "flush-user-activity": {
+        "task": "user.tasks.flush_user_activity",
+        "schedule": USER_ACTIVITY_FLUSH_INTERVAL,
+    },
+    "drain-timeline-outbox": {
+        "task": "timeline.tasks.drain_timeline_outbox",
+        "schedule": TIMELINE_OUTBOX_DRAIN_INTERVAL,
+    },
+}
+
+# SCREENSHOT UPLOADS (feedback.images)
+# The screenshots of one request are uploaded to storage on at most this many threads.
+SCREENSHOT_UPLOAD_WORKERS = 9
+# The largest image a base64 encoded upload may decode to (feedback.serializers.Base64ImageField).
+BASE64_IMAGE_MAX_DECODED_SIZE = 10 * 1024 * 1024  # bytes
+
 # DJANGO REDIS CONFIGURATION
 # CACHES
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        # django_redis.cache.RedisCache, counting its hits and misses for /metrics.
+        "BACKEND": "shared.metrics.InstrumentedRedisCache",
         "LOCATION": "redis://127.0.0.1:6379/1",
         "OPTIONS": {
             "PARSER_CLASS": "redis.connection.HiredisParser",
@@ -375,6 +423,42 @@ CACHES = {
 }
 DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
 
+# RESPONSE CACHE (shared.cache)
+RESPONSE_CACHE_ALIAS = "default"
+RESPONSE_CACHE_TIMEOUT = 60 * 5  # seconds
+# How long clients may reuse the lists served by feedback.views.static_json_view before revalidating.
+STATIC_JSON_MAX_AGE = 60 * 60 * 24  # seconds
+# The number of feedback read and serialized at a time by the streaming export (feedback.export).
+FEEDBACK_EXPORT_CHUNK_SIZE = 2000
+# The number of lines validated and written per transaction by the bulk import (feedback.importer).
+FEEDBACK_IMPORT_BATCH_SIZE = 1000
+# The list views served by their compiled serializer (shared.compiled), as "<basename>.<action>" such as
+# "feedbackmodel.list", "timelinemodel.list" or "user.list".
+# The output is the same, so views can be switched one at a time.
+COMPILED_SERIALIZER_VIEWS = [name for name in os.getenv("COMPILED_SERIALIZER_VIEWS", "").split(",") if name]
+
+# REQUEST PROFILING (shared.profiling)
+# The share of requests, from 0 to 1, whose SQL queries and serializer time are sent in a Server-Timing header
+# and logged to the "shared.profiling" logger.
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv("REQUEST_PROFILING_SAMPLE_RATE", "0.01"))
+# The number of times one query shape may run in a profiled request before it is logged as an N+1.
+REQUEST_PROFILING_N_PLUS_ONE_THRESHOLD = 5
+
+# METRICS (shared.metrics)
+# The directory the processes write their metrics to, for /metrics to add up. Set by gunicorn.conf.py for the
+# gunicorn workers. A Celery worker on the same host writes its task metrics there too if it is set for it.
+# Unset, /metrics only serves the metrics of the process answering it.
+METRICS_DIR = os.getenv("METRICS_DIR")
+# How often each process writes its metrics to METRICS_DIR.
+METRICS_WRITE_INTERVAL = 5  # seconds
+# /metrics is served to requests sending METRICS_TOKEN as a bearer token, and to the addresses (REMOTE_ADDR) in
+# METRICS_ALLOWED_NETWORKS, a comma separated list like "127.0.0.1/32,10.1.0.0/16". With neither set, /metrics
+# is refused. Behind a load balancer, REMOTE_ADDR is the balancer's for every request, so use the token there.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_ALLOWED_NETWORKS = [network for network in os.getenv("METRICS_ALLOWED_NETWORKS", "").split(",") if network]
+# The Celery tasks whose run time and outcome are recorded.
+METRICS_CELERY_TASKS = ["user.tasks.send_new_user_email", "user.tasks.send_reset_email"]
+
 # from django_redis import get_redis_connection
 #
 # r = get_redis_connection("default")  # Use the name you have defined for Redis in settings.CACHES
@@ -398,6 +482,9 @@ LOGGING = {
         "console": {"class": "logging.StreamHandler"}
     },
     "root": {"handlers": ["console"], "level": "WARNING"},
+    "loggers": {
+        "shared.profiling": {"level": "INFO"},
+    },
     # 'loggers': {
     #     'django': {
     #         'handlers': ['file'],
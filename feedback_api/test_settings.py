@@ -0,0 +1,39 @@
+"""
+Settings for `manage.py test`, which manage.py selects for the test command.
+
+The production settings with SQLite, local file storage and a local memory cache standing in for
+PostgreSQL, S3 and Redis, and Celery tasks run in the calling process.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from .settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(tempfile.gettempdir(), "feedback-test.sqlite3"),
+    }
+}
+# The apps ship no migrations, so the test database is created from the models.
+MIGRATION_MODULES = {"user": None, "feedback": None, "timeline": None}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "test",
+    }
+}
+DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
+MEDIA_ROOT = os.path.join(tempfile.gettempdir(), "feedback-test-media")
+MEDIA_URL = "/media/"
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_BROKER_URL = "memory://"
+CELERY_RESULT_BACKEND = "cache+memory://"
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != "debug_toolbar"]  # noqa: F405
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if "debug_toolbar" not in middleware]  # noqa: F405
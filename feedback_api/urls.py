@@ -24,6 +24,7 @@ from drf_spectacular.views import (
 from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
 
 # from feedback.views import AppsView
+from shared.metrics import metrics_view
 from user.views import MyTokenObtainPairView, Logout
 
 app_name = "feedback"
@@ -46,6 +47,7 @@ urlpatterns = [
     path(
         "api/v1/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"
     ),
+    path("metrics", metrics_view, name="metrics"),
     path("admin/", admin.site.urls),
     path("i18n/", include("django.conf.urls.i18n")),
     path("api/v1/feedback/", include("feedback.urls")),
@@ -0,0 +1,17 @@
+"""
+Gunicorn settings, read from the working directory by `gunicorn feedback_api.wsgi`.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+# The workers write their metrics here for /metrics to add up (shared.metrics).
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "feedback-metrics"))
+
+
+def on_starting(server):
+    """ Remove the metrics of the workers of an earlier server, so the counters start from zero. """
+    metrics_dir = Path(os.environ["METRICS_DIR"])
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    for path in metrics_dir.glob("*.json*"):
+        path.unlink(missing_ok=True)
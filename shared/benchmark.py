@@ -0,0 +1,281 @@
+"""
+Endpoint benchmarks over a seeded dataset, run by `manage.py benchmark`.
+
+The database is seeded with a configurable number of users, feedback, screenshots and timeline events,
+then every scenario requests its endpoint through the full Django stack. Each scenario reports the
+latency percentiles of the timed requests, the SQL queries of one request, and the memory allocated by a
+few requests under tracemalloc. The three are measured in separate passes, so the query capture and
+tracemalloc never slow down the timed requests.
+"""
+import io
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from collections import Counter
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from feedback.enums import PLAYSTORE_APPS_CATEGORY
+from feedback.models import FeedbackModel, ImageModel
+from timeline.enums import TIMELINE_CATEGORY
+from timeline.models import TimelineModel
+from user.models import User
+
+BENCHMARK_PASSWORD = "benchmark-password"
+SEED_BATCH_SIZE = 1000
+
+
+def create_png(size: int = 64) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), (64, 128, 192)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def seed(users: int, feedback: int, screenshots: int, timeline: int, random_seed: int = 0) -> dict:
+    """
+    Fill the database with a reproducible dataset, with one bulk INSERT per table and batch.
+    :param users: The number of users
+    :param feedback: The number of feedback, owned round robin by the users
+    :param screenshots: The number of screenshots per feedback, all backed by one stored image
+    :param timeline: The number of timeline events
+    :param random_seed: The seed of the generated values
+    :return: The ids the scenarios request, by model
+    """
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    password = make_password(BENCHMARK_PASSWORD)
+    user_objs = User.objects.bulk_create([
+        User(
+            email=f"user{index}@benchmark.test", password=password, firstname=f"First{index}",
+            lastname=f"Last{index}", country="Nigeria", is_verified=True, is_registered=True,
+        )
+        for index in range(users)
+    ], batch_size=SEED_BATCH_SIZE)
+
+    categories = [category for category, _ in PLAYSTORE_APPS_CATEGORY]
+    feedback_objs = FeedbackModel.objects.bulk_create([
+        FeedbackModel(
+            owner=user_objs[index % users].id, title=f"Benchmark app {index}",
+            description=f"Short description of app {index}"[:200],
+            long_description=" ".join(rng.choices(("fast", "simple", "private", "offline", "shared"), k=rng.randint(20, 300)))[:2000],
+            category=rng.choice(categories), website=f"https://app{index}.benchmark.test",
+            clicks=rng.randint(0, 5000), views=rng.randint(0, 50000), likes_count=rng.randint(0, 500),
+            created_at=now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+        )
+        for index in range(feedback)
+    ], batch_size=SEED_BATCH_SIZE)
+
+    image_name = default_storage.save("images/benchmark.png", ContentFile(create_png()))
+    variants = {name: f"images/variants/benchmark/{name}.webp" for name in ("thumbnail", "medium", "large")}
+    image_objs = ImageModel.objects.bulk_create([
+        ImageModel(image=image_name, variants=variants, variants_source=image_name)
+        for _ in range(feedback * screenshots)
+    ], batch_size=SEED_BATCH_SIZE)
+    link_model = FeedbackModel.screenshot.through
+    link_model.objects.bulk_create([
+        link_model(feedbackmodel_id=feedback_objs[index // screenshots].id, imagemodel_id=image.id)
+        for index, image in enumerate(image_objs)
+    ], batch_size=SEED_BATCH_SIZE)
+
+    timeline_categories = [category for category, _ in TIMELINE_CATEGORY]
+    timeline_objs = []
+    for index in range(timeline):
+        feedback_obj = feedback_objs[index % feedback] if feedback and index % 2 == 0 else None
+        timeline_objs.append(TimelineModel(
+            user=feedback_obj.owner if feedback_obj else rng.choice(user_objs).id,
+            app=feedback_obj.id if feedback_obj else None, entity="APP" if feedback_obj else "USER",
+            category=rng.choice(timeline_categories), created_at=now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+        ))
+    TimelineModel.objects.bulk_create(timeline_objs, batch_size=SEED_BATCH_SIZE)
+    return {"users": [user.id for user in user_objs], "feedback": [obj.id for obj in feedback_objs]}
+
+
+class Scenario:
+    """ One endpoint request, parametrized by the iteration number so requests can rotate through ids. """
+
+    def __init__(self, name: str, method: str, path: str, request):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.request = request
+
+
+def get_scenarios(ids: dict) -> list:
+    """ Return the benchmarked scenarios over the seeded ids. """
+    client = APIClient()
+    author = User.objects.get(pk=ids["users"][0])
+    author_client = APIClient()
+    # FeedbackView has no authenticators, so the author is attached to the request directly.
+    author_client.force_authenticate(user=author)
+    png = create_png()
+
+    def create_feedback(index):
+        return author_client.post("/api/v1/feedback/", {
+            "title": f"Created app {index}", "description": "Created by the benchmark",
+            "long_description": "Created by the benchmark", "category": PLAYSTORE_APPS_CATEGORY[0][0],
+            "website": "https://created.benchmark.test",
+            "screenshot": [SimpleUploadedFile(f"screenshot{index}.png", png, content_type="image/png")],
+        }, format="multipart")
+
+    return [
+        Scenario("feedback.list", "GET", "/api/v1/feedback/", lambda index: client.get("/api/v1/feedback/")),
+        Scenario(
+            "feedback.retrieve", "GET", "/api/v1/feedback/<id>/",
+            lambda index: client.get(f"/api/v1/feedback/{ids['feedback'][index % len(ids['feedback'])]}/"),
+        ),
+        Scenario("timeline.list", "GET", "/api/v1/timeline/", lambda index: client.get("/api/v1/timeline/")),
+        Scenario(
+            "user.user_apps", "GET", "/api/v1/user/<id>/feedback/",
+            lambda index: client.get(f"/api/v1/user/{ids['users'][index % len(ids['users'])]}/feedback/"),
+        ),
+        Scenario("feedback.create", "POST", "/api/v1/feedback/", create_feedback),
+        Scenario(
+            "token", "POST", "/api/v1/token/",
+            lambda index: client.post("/api/v1/token/", {"email": author.email, "password": BENCHMARK_PASSWORD}, format="json"),
+        ),
+    ]
+
+
+def percentile(values: list, percent: float) -> float:
+    """ The nearest-rank percentile of the values. """
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))]
+
+
+def run_scenario(scenario: Scenario, iterations: int, warmup: int, warm_cache: bool = False) -> dict:
+    """
+    Measure a scenario.
+    :param iterations: The number of timed requests
+    :param warmup: The number of untimed requests made first
+    :param warm_cache: Whether responses may be served from the response cache. By default it is cleared
+        before every request, so every request does the full work.
+    :return: The latency percentiles in milliseconds, the status codes, the queries of one request and the
+        allocations of a few requests
+    """
+    cache = caches[settings.RESPONSE_CACHE_ALIAS]
+    index = 0
+
+    def request():
+        nonlocal index
+        index += 1
+        return scenario.request(index)
+
+    for _ in range(warmup):
+        request()
+
+    timings, statuses = [], Counter()
+    for _ in range(iterations):
+        if not warm_cache:
+            cache.clear()
+        start = time.perf_counter()
+        response = request()
+        timings.append((time.perf_counter() - start) * 1000)
+        statuses[str(response.status_code)] += 1
+
+    if not warm_cache:
+        cache.clear()
+    with CaptureQueriesContext(connection) as context:
+        request()
+    queries = context.captured_queries
+
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(min(5, iterations)):
+            if not warm_cache:
+                cache.clear()
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            request()
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - before) / 1024)
+            retained.append((after - before) / 1024)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "method": scenario.method,
+        "path": scenario.path,
+        "status": dict(statuses),
+        "latency_ms": {
+            "min": round(min(timings), 3),
+            "p50": round(percentile(timings, 50), 3),
+            "p90": round(percentile(timings, 90), 3),
+            "p99": round(percentile(timings, 99), 3),
+            "max": round(max(timings), 3),
+            "mean": round(statistics.fmean(timings), 3),
+        },
+        "queries": len(queries),
+        "sql_ms": round(sum(float(query["time"]) for query in queries) * 1000, 3),
+        "allocations_kib": {
+            "peak": round(statistics.median(peaks), 1),
+            "retained": round(statistics.median(retained), 1),
+        },
+    }
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scenarios: list, iterations: int, warmup: int, warm_cache: bool = False, seeded=None) -> dict:
+    """
+    Run the scenarios and return the report.
+    :param seeded: The dataset counts, recorded in the report
+    """
+    return {
+        "meta": {
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "dataset": seeded or {},
+            "iterations": iterations,
+            "warmup": warmup,
+            "warm_cache": warm_cache,
+            "compiled_serializer_views": list(settings.COMPILED_SERIALIZER_VIEWS),
+        },
+        "scenarios": {
+            scenario.name: run_scenario(scenario, iterations, warmup, warm_cache) for scenario in scenarios
+        },
+    }
+
+
+def compare_reports(baseline: dict, report: dict) -> list:
+    """
+    Compare the p50 latency, queries and peak allocations of two reports.
+    :return: A line of text per scenario in both reports
+    """
+    lines = []
+    for name, result in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        p50_before, p50_after = before["latency_ms"]["p50"], result["latency_ms"]["p50"]
+        change = (p50_after - p50_before) / p50_before * 100 if p50_before else 0.0
+        lines.append(
+            f"{name:<20} p50 {p50_before:>9.3f} -> {p50_after:>9.3f} ms ({change:+.1f}%)  "
+            f"queries {before['queries']} -> {result['queries']}  "
+            f"peak {before['allocations_kib']['peak']} -> {result['allocations_kib']['peak']} KiB"
+        )
+    return lines
@@ -0,0 +1,149 @@
+"""
+Response caching for read endpoints, with tag based invalidation.
+
+Every cached response is stored under a key built from the view, the action, the URL kwargs and the
+normalized query parameters, plus the current version of each of its tags. Invalidating a tag swaps
+its version, so every response carrying that tag is missed on the next read and expires on its own.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .metrics import RESPONSE_CACHE_REQUESTS
+
+def get_tag_key(tag: str) -> str:
+    return f"response-tag:{tag}"
+
+
+def get_tag_versions(cache, tags) -> list:
+    """
+    Return the current version of each tag, creating the versions that are missing.
+    New versions are time based so a tag whose version was evicted never reuses an old version.
+    """
+    tag_keys = [get_tag_key(tag) for tag in tags]
+    versions = cache.get_many(tag_keys)
+    missing = {tag_key: time.time_ns() for tag_key in tag_keys if tag_key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[tag_key] for tag_key in tag_keys]
+
+
+def invalidate_tags(*tags):
+    """
+    Invalidate every cached response carrying any of the tags.
+    Inside a transaction, the invalidation is deferred until the transaction commits so a read
+    between the invalidation and the commit cannot cache the old rows again.
+    """
+    tags = [str(tag) for tag in tags if tag]
+    if not tags:
+        return
+
+    def _invalidate():
+        version = time.time_ns()
+        caches[settings.RESPONSE_CACHE_ALIAS].set_many({get_tag_key(tag): version for tag in tags}, timeout=None)
+
+    transaction.on_commit(_invalidate)
+
+
+def get_normalized_query(request) -> list:
+    """ Return the query parameters sorted by name and value, without blank parameters. """
+    return sorted(
+        (param, sorted(values))
+        for param, values in request.query_params.lists()
+        if any(value != "" for value in values)
+    )
+
+
+def cache_response(tags=(), timeout=None):
+    """
+    Cache the rendered JSON of a successful viewset action.
+    Under conditional_response, the ETag is part of the cache key, so a cached response is never sent
+    with the ETag of a newer version.
+    :param tags: The tags to invalidate the response by. They are formatted with the URL kwargs,
+        so "feedback:{pk}" tags a detail response with its primary key.
+    :param timeout: The cache timeout in seconds. Defaults to settings.RESPONSE_CACHE_TIMEOUT.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            view_name = f"{view.basename}.{view.action}"
+            if getattr(request.accepted_renderer, "format", None) != "json":
+                return func(view, request, *args, **kwargs)
+
+            cache = caches[settings.RESPONSE_CACHE_ALIAS]
+            response_tags = [tag.format(**kwargs) for tag in tags]
+            key_parts = repr((
+                view_name, request.get_host(), sorted(kwargs.items()), get_normalized_query(request),
+                get_tag_versions(cache, response_tags), getattr(request, "response_etag", None),
+            ))
+            cache_key = f"response:{view_name}:{hashlib.sha1(key_parts.encode()).hexdigest()}"
+
+            cached = cache.get(cache_key)
+            if cached is not None:
+                RESPONSE_CACHE_REQUESTS.inc(view_name, "hit")
+                response = HttpResponse(cached, content_type=request.accepted_media_type)
+                response["X-Cache"] = "HIT"
+                return response
+
+            RESPONSE_CACHE_REQUESTS.inc(view_name, "miss")
+            response = func(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                content = request.accepted_renderer.render(
+                    response.data, request.accepted_media_type, view.get_renderer_context()
+                )
+                cache.set(cache_key, content, timeout or settings.RESPONSE_CACHE_TIMEOUT)
+            response["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def conditional_response(get_validators: str):
+    """
+    Answer a conditional GET of a viewset action with 304 Not Modified before the action runs,
+    and add ETag and Last-Modified headers to its successful responses.
+    :param get_validators: The name of a view method that takes the request and the URL kwargs and returns a
+        (version, last_modified) pair, or None if the response cannot be validated, like for a missing object.
+        The version is any value whose repr changes whenever the response does.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            validators = getattr(view, get_validators)(request, **kwargs)
+            if validators is None:
+                return func(view, request, *args, **kwargs)
+
+            version, last_modified = validators
+            etag_parts = repr((
+                f"{view.basename}.{view.action}", sorted(kwargs.items()), get_normalized_query(request),
+                request.accepted_media_type, version,
+            ))
+            etag = quote_etag(hashlib.sha1(etag_parts.encode()).hexdigest())
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                request.response_etag = etag
+                response = func(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+            return response
+
+        return wrapper
+
+    return decorator
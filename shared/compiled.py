@@ -0,0 +1,198 @@
+"""
+Compiled read-only serializers for list endpoints.
+
+A CompiledSerializer reproduces the output of a read-only ModelSerializer without running DRF per row and
+per field. The fields of the serializer are compiled once per serializer class and sparse fieldset into a
+plan of (field name, column, converter), rows are read with QuerySet.values(), and each row is converted
+by walking the plan. Nested objects, like the owner of a feedback, are filled in for the whole page at once
+by the resolve() hook of a subclass.
+
+Only fields whose DRF representation is known are compiled, and each converter is the DRF field's own
+to_representation or an equivalent shortcut, so the output is the same as the serializer's. A serializer
+with any other kind of field raises NotCompilable and is served by DRF instead.
+
+A view opts in with CompiledListMixin, and is only switched over once "<basename>.<action>" is listed in
+settings.COMPILED_SERIALIZER_VIEWS.
+"""
+import functools
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from shared.profiling import serializer_timer
+
+logger = logging.getLogger(__name__)
+
+# Converted with str(), as the DRF field does.
+STRING_FIELDS = (serializers.CharField, serializers.EmailField, serializers.URLField, serializers.SlugField)
+# Converted with the DRF field's own to_representation, which does not depend on the serializer context.
+CONTEXT_FREE_FIELDS = (
+    serializers.BooleanField, serializers.DateTimeField, serializers.DateField, serializers.TimeField,
+    serializers.DecimalField, serializers.FloatField, serializers.JSONField, serializers.ReadOnlyField,
+)
+FILE_FIELDS = (serializers.FileField, serializers.ImageField)
+
+
+class NotCompilable(Exception):
+    """ The serializer has a field the compiled serializers cannot reproduce. """
+
+
+def compile_converter(field):
+    """
+    Return the function converting a non-null column value to the field's representation.
+    File fields return None, as their URL depends on the request and is built by CompiledSerializer.
+    """
+    field_type = type(field)
+    if field_type is serializers.UUIDField:
+        return str if field.uuid_format == "hex_verbose" else field.to_representation
+    if field_type in STRING_FIELDS:
+        return str
+    if field_type is serializers.ChoiceField:
+        choices = field.choice_strings_to_values
+        return lambda value: value if value == "" else choices.get(str(value), value)
+    if field_type is serializers.IntegerField:
+        return int
+    if field_type in CONTEXT_FREE_FIELDS:
+        return field.to_representation
+    if field_type in FILE_FIELDS:
+        return None
+    raise NotCompilable(f"{field.parent.__class__.__name__}.{field.field_name} is a {field_type.__name__}")
+
+
+@functools.lru_cache(maxsize=256)
+def compile_plan(serializer_class, fieldset_key: str, nested_fields: tuple) -> tuple:
+    """
+    Compile the fields of a serializer class into a plan.
+    :param serializer_class: The ModelSerializer class
+    :param fieldset_key: The sparse fieldset (shared.fieldsets) as JSON with sorted keys
+    :param nested_fields: The fields filled in by the resolve() hook. They are left None by the plan.
+    :return: A tuple of (field name, column, converter, file field) per readable field. The column is None
+        for nested fields that are not a column, and the file field is set in place of the converter for
+        file fields.
+    """
+    serializer = serializer_class(context={"fieldset": json.loads(fieldset_key)})
+    model = serializer.Meta.model
+    plan = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source_attrs[0]) if field.source_attrs else None
+        except FieldDoesNotExist:
+            model_field = None
+        is_column = model_field is not None and model_field.concrete and not model_field.many_to_many
+        if name in nested_fields:
+            plan.append((name, model_field.name if is_column else None, None, None))
+            continue
+        if not is_column or len(field.source_attrs) != 1:
+            raise NotCompilable(f"{serializer_class.__name__}.{name} is not read from a column")
+        converter = compile_converter(field)
+        plan.append((name, model_field.name, converter, (field, model_field) if converter is None else None))
+    return tuple(plan)
+
+
+class CompiledSerializer:
+    """
+    The compiled, read-only counterpart of a ModelSerializer.
+    :param context: The serializer context. The request, if any, makes file URLs absolute, and the fieldset,
+        if any, selects the fields.
+    """
+    serializer_class = None
+    # The fields filled in by resolve(), such as nested objects, in place of their column representation.
+    nested_fields = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.fieldset = self.context.get("fieldset")
+        self.plan = compile_plan(
+            self.serializer_class, json.dumps(self.fieldset, sort_keys=True), tuple(self.nested_fields)
+        )
+        self.fields = [name for name, *_ in self.plan]
+
+    @property
+    def columns(self) -> list:
+        return [column for _, column, _, _ in self.plan if column is not None]
+
+    def get_rows(self, queryset, keep=("id",)):
+        """
+        Return the queryset as dicts of the columns the plan reads.
+        :param queryset: The queryset the serializer would be given
+        :param keep: The columns read besides, like the pagination keys or the columns resolve() needs
+        """
+        return queryset.prefetch_related(None).values(*dict.fromkeys((*keep, *self.columns)))
+
+    def get_file_converter(self, field, model_field):
+        """ Return the converter of a file name, which builds the URL like the DRF FileField does. """
+        storage = model_field.storage
+        request = self.context.get("request")
+        use_url = getattr(field, "use_url", api_settings.UPLOADED_FILES_USE_URL)
+
+        def convert(name):
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return convert
+
+    def serialize(self, rows) -> list:
+        """
+        Serialize the rows of get_rows(), as serializer_class(rows, many=True).data would.
+        :param rows: A list of rows
+        :return: A list of dicts
+        """
+        with serializer_timer():
+            plan = [
+                (name, column, self.get_file_converter(*file_field) if file_field is not None else converter)
+                for name, column, converter, file_field in self.plan
+            ]
+            data = [
+                {
+                    name: None if converter is None or row[column] is None else converter(row[column])
+                    for name, column, converter in plan
+                }
+                for row in rows
+            ]
+            self.resolve(rows, data)
+        return data
+
+    def resolve(self, rows, data):
+        """ Fill in the nested fields of a page of serialized rows. """
+
+
+class CompiledListMixin:
+    """
+    Serve the list action of a viewset with its compiled serializer, once the view is enabled in
+    settings.COMPILED_SERIALIZER_VIEWS.
+    """
+    compiled_serializer_class = None
+    # The columns read whatever fields are selected, like the pagination keys.
+    compiled_keep = ("id", "created_at")
+
+    def use_compiled_serializer(self) -> bool:
+        return (
+            self.compiled_serializer_class is not None
+            and f"{self.basename}.{self.action}" in settings.COMPILED_SERIALIZER_VIEWS
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_compiled_serializer():
+            return super().list(request, *args, **kwargs)
+        try:
+            compiled = self.compiled_serializer_class(context=self.get_serializer_context())
+        except NotCompilable as exc:
+            logger.warning("Serving %s.%s with DRF: %s", self.basename, self.action, exc)
+            return super().list(request, *args, **kwargs)
+
+        rows = compiled.get_rows(self.filter_queryset(self.get_queryset()), keep=self.compiled_keep)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.serialize(page))
+        return Response(compiled.serialize(list(rows)))
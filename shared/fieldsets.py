@@ -0,0 +1,115 @@
+"""
+Sparse fieldsets for read endpoints.
+
+Clients pick the fields of a response with `?fields=` or drop fields with `?omit=`, both comma separated
+serializer field names, where a dotted name reaches into a nested object:
+`?fields=id,title,owner.firstname,screenshot.image` or `?omit=long_description,owner.address`.
+The serializer output is trimmed to the selected fields, and the view reads only the columns those fields
+come from, so the payload and the database I/O shrink together. Unknown names are ignored.
+
+A fieldset is an (include, omit) pair of trees such as {"owner": {"firstname": {}}}, where an empty tree
+selects the whole field. None on either side means no restriction.
+"""
+from django.core.exceptions import FieldDoesNotExist
+
+FIELDS_PARAM = "fields"
+OMIT_PARAM = "omit"
+
+
+def parse_fieldset(value: str):
+    """ Parse a comma separated list of dotted field names into a tree, or None if it is blank. """
+    tree = {}
+    for name in (value or "").split(","):
+        node = tree
+        for part in name.strip().split("."):
+            if part:
+                node = node.setdefault(part, {})
+    return tree or None
+
+
+def get_request_fieldset(request):
+    """ Return the fieldset of the request's query parameters, or None if it selects every field. """
+    include = parse_fieldset(request.query_params.get(FIELDS_PARAM))
+    omit = parse_fieldset(request.query_params.get(OMIT_PARAM))
+    return None if include is None and omit is None else (include, omit)
+
+
+def get_nested_fieldset(fieldset, name: str):
+    """ Return the fieldset of the nested object under `name`, or None if every field of it is selected. """
+    include, omit = fieldset or (None, None)
+    include, omit = (include or {}).get(name) or None, (omit or {}).get(name) or None
+    return None if include is None and omit is None else (include, omit)
+
+
+def is_selected(fieldset, name: str) -> bool:
+    """ Whether the fieldset selects the field, in whole or in part. """
+    include, omit = fieldset or (None, None)
+    if include is not None and name not in include:
+        return False
+    return omit is None or omit.get(name, None) != {}
+
+
+def get_selected_columns(serializer, model):
+    """
+    Return the names of the model fields the serializer's readable fields are read from.
+    Many-to-many and reverse relations are skipped, as they are never columns of the model.
+    :return: The field names, or None if a field is computed from something other than one model field,
+        in which case every column is needed.
+    """
+    columns = []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if not field.source_attrs:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source_attrs[0])
+        except FieldDoesNotExist:
+            return None
+        if model_field.concrete and not model_field.many_to_many:
+            columns.append(model_field.name)
+    return columns
+
+
+class FieldsetSerializerMixin:
+    """ Trim the fields of a serializer to the fieldset in its context. """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get("fieldset")
+        if fieldset is None:
+            return fields
+        return {name: field for name, field in fields.items() if is_selected(fieldset, name)}
+
+
+class FieldsetViewMixin:
+    """
+    Accept ?fields= and ?omit= on the read actions of a viewset.
+    The fieldset is passed to the serializer in its context, and prune_queryset() restricts a queryset to
+    the columns of the selected fields.
+    """
+    fieldset_actions = ("list", "retrieve")
+
+    def get_fieldset(self):
+        if self.action not in self.fieldset_actions:
+            return None
+        return get_request_fieldset(self.request)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fieldset"] = self.get_fieldset()
+        return context
+
+    def prune_queryset(self, queryset, keep=("id",)):
+        """
+        Read only the columns of the selected fields of the action's serializer.
+        :param queryset: The queryset the serializer's instances are read from
+        :param keep: The columns read whatever is selected, such as the primary key and the pagination keys
+        :return: The queryset, unchanged when every field is selected
+        """
+        if self.get_fieldset() is None:
+            return queryset
+        columns = get_selected_columns(self.get_serializer(), queryset.model)
+        if columns is None:
+            return queryset
+        return queryset.only(*keep, *columns)
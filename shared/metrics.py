@@ -0,0 +1,461 @@
+"""
+Prometheus metrics, served in the text exposition format at /metrics.
+
+The metrics are kept in-process. Every thread counts into its own dict, so recording a value never takes a
+lock. The dicts are only summed when the metrics are collected. Under gunicorn every worker is a process of
+its own. A thread of each process writes a snapshot of its metrics to settings.METRICS_DIR every
+settings.METRICS_WRITE_INTERVAL seconds and on exit, and /metrics adds the snapshots of the other processes
+to its own. /metrics folds the snapshots of the processes that have exited into one, so the counters never go
+down and the snapshots of restarted workers don't pile up. The gunicorn settings (gunicorn.conf.py) clear the
+directory when the server starts.
+
+Recorded:
+- the latency and status of the requests by view and action (MetricsMiddleware)
+- the hits and misses of the django-redis cache (InstrumentedRedisCache)
+- the hits and misses of the response cache by view (shared.cache.cache_response)
+- the run time and outcome of the Celery tasks in settings.METRICS_CELERY_TASKS
+- the database connections opened, and the requests that found one open to reuse
+"""
+import atexit
+import bisect
+import fcntl
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from celery import signals as celery_signals
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django_redis.cache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def merge_values(into: dict, values: dict):
+    """ Add values, keyed by (metric name, label values), into another dict of them. """
+    for key, value in values.items():
+        if isinstance(value, list):
+            existing = into.get(key)
+            if existing is None:
+                into[key] = list(value)
+            else:
+                for index, count in enumerate(value):
+                    existing[index] += count
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+class Registry:
+    """ The metrics of the process, with a dict of values per thread. """
+
+    def __init__(self):
+        self.metrics = {}
+        self.local = threading.local()
+        self.shards = []
+        # The summed values of the threads that have finished.
+        self.retired = {}
+        self.lock = threading.Lock()
+
+    def get_values(self) -> dict:
+        """ Return the values of the current thread, which only this thread writes. """
+        try:
+            return self.local.values
+        except AttributeError:
+            values = self.local.values = {}
+            with self.lock:
+                self.shards.append((threading.current_thread(), values))
+            return values
+
+    def collect(self) -> dict:
+        """ Return the sum of the values of all threads, keyed by (metric name, label values). """
+        with self.lock:
+            live = []
+            for thread, values in self.shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    merge_values(self.retired, values)
+            self.shards = live
+            collected = {}
+            merge_values(collected, self.retired)
+            for _, values in live:
+                merge_values(collected, values.copy())
+        return collected
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.registry = registry
+        registry.metrics[name] = self
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        values = self.registry.get_values()
+        key = (self.name, labelvalues)
+        values[key] = values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    """ A histogram, kept as a count per bucket, a count past the last bucket and the sum of the values. """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = REQUEST_BUCKETS, **kwargs):
+        super().__init__(name, documentation, labelnames, **kwargs)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labelvalues):
+        values = self.registry.get_values()
+        key = (self.name, labelvalues)
+        counts = values.get(key)
+        if counts is None:
+            counts = values[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "The requests served, by view, action, method and status.",
+    ("view", "action", "method", "status"),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "The time taken to serve requests, by view and action.", ("view", "action"),
+)
+CACHE_REQUESTS = Counter("django_redis_cache_requests_total", "The reads of the django-redis cache, by result.", ("result",))
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total", "The reads of the response cache (shared.cache), by view and result.",
+    ("view", "result"),
+)
+CELERY_TASKS = Counter("celery_tasks_total", "The Celery tasks run, by task and state.", ("task", "state"))
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "The run time of Celery tasks, by task.", ("task",), buckets=TASK_BUCKETS,
+)
+DB_CONNECTIONS_OPENED = Counter(
+    "django_db_connections_opened_total", "The database connections opened, by database alias.", ("alias",),
+)
+DB_CONNECTIONS_REUSED = Counter(
+    "django_db_connections_reused_total",
+    "The requests that started with a database connection already open, by database alias.", ("alias",),
+)
+
+
+# MULTIPROCESS AGGREGATION
+
+# The snapshot the metrics of the processes that have exited are added up in.
+EXITED_SNAPSHOT = "exited.json"
+
+_snapshot = {"pid": None, "path": None, "writer_pid": None}
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot_path() -> str:
+    """ Return the snapshot file of this process, named anew after a fork. """
+    if _snapshot["pid"] != os.getpid():
+        _snapshot["pid"] = os.getpid()
+        _snapshot["path"] = os.path.join(settings.METRICS_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+    return _snapshot["path"]
+
+
+def write_values(path: str, values: dict, **extra):
+    """ Write values, keyed by (metric name, label values), to a snapshot file, replacing it atomically. """
+    content = [[name, list(labels), value] for (name, labels), value in values.items()]
+    with open(f"{path}.tmp", "w") as snapshot_file:
+        json.dump({"values": content, **extra} if extra else content, snapshot_file)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_snapshot(path: str) -> tuple:
+    """
+    Read a snapshot file.
+    :return: (values keyed by (metric name, label values), the names of the snapshots folded into it)
+    """
+    with open(path) as snapshot_file:
+        content = json.load(snapshot_file)
+    folded = []
+    if isinstance(content, dict):
+        content, folded = content["values"], content["folded"]
+    return {(name, tuple(labels)): value for name, labels, value in content}, folded
+
+
+def write_snapshot():
+    """ Write the metrics of this process to settings.METRICS_DIR, if set. """
+    if not settings.METRICS_DIR:
+        return
+    with _snapshot_lock:
+        path = get_snapshot_path()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        write_values(path, REGISTRY.collect())
+
+
+def write_snapshots():
+    while True:
+        try:
+            write_snapshot()
+        except OSError:
+            logger.exception("Could not write the metrics to %s", settings.METRICS_DIR)
+        time.sleep(settings.METRICS_WRITE_INTERVAL)
+
+
+def start_snapshot_writer():
+    """
+    Start the thread writing the snapshot of this process every settings.METRICS_WRITE_INTERVAL seconds.
+    Called as metrics are recorded, so it is started once in every process, including forked workers.
+    """
+    if not settings.METRICS_DIR or _snapshot["writer_pid"] == os.getpid():
+        return
+    with _snapshot_lock:
+        if _snapshot["writer_pid"] == os.getpid():
+            return
+        _snapshot["writer_pid"] = os.getpid()
+    threading.Thread(target=write_snapshots, name="metrics-snapshot-writer", daemon=True).start()
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fold_exited_snapshots():
+    """
+    Add the snapshots of the processes that have exited to EXITED_SNAPSHOT, and remove them.
+    The names of the snapshots folded are kept in EXITED_SNAPSHOT until they are removed, so a fold that
+    failed before removing them never adds them twice. Called under the lock of collect_all().
+    """
+    exited_path = os.path.join(settings.METRICS_DIR, EXITED_SNAPSHOT)
+    names = set(os.listdir(settings.METRICS_DIR))
+    try:
+        exited, folded = read_snapshot(exited_path)
+    except FileNotFoundError:
+        exited, folded = {}, []
+    folded = [name for name in folded if name in names]
+    for name in sorted(names - set(folded)):
+        pid, _, _ = name.partition("-")
+        if not name.endswith(".json") or not pid.isdigit() or is_process_alive(int(pid)):
+            continue
+        try:
+            values, _ = read_snapshot(os.path.join(settings.METRICS_DIR, name))
+        except (OSError, ValueError):
+            # Never completely written.
+            continue
+        merge_values(exited, values)
+        folded.append(name)
+    if not folded:
+        return
+    write_values(exited_path, exited, folded=folded)
+    for name in folded:
+        try:
+            os.unlink(os.path.join(settings.METRICS_DIR, name))
+        except FileNotFoundError:
+            pass
+    write_values(exited_path, exited, folded=[])
+
+
+def collect_all() -> dict:
+    """ Return the metrics of this process, plus the snapshots of the other processes in settings.METRICS_DIR. """
+    collected = REGISTRY.collect()
+    if not settings.METRICS_DIR or not os.path.isdir(settings.METRICS_DIR):
+        return collected
+    own_path = get_snapshot_path()
+    # Held by every worker answering /metrics, so none reads the snapshots while another folds them.
+    with open(os.path.join(settings.METRICS_DIR, "collect.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            fold_exited_snapshots()
+        except (OSError, ValueError, KeyError):
+            logger.exception("Could not fold the metrics of the exited processes in %s", settings.METRICS_DIR)
+        snapshots, skipped = [], set()
+        for entry in os.scandir(settings.METRICS_DIR):
+            if not entry.name.endswith(".json") or entry.path == own_path:
+                continue
+            try:
+                values, folded = read_snapshot(entry.path)
+            except (OSError, ValueError, KeyError):
+                continue
+            snapshots.append((entry.name, values))
+            # Snapshots a failed fold added to EXITED_SNAPSHOT without removing them.
+            skipped.update(folded)
+    for name, values in snapshots:
+        if name not in skipped:
+            merge_values(collected, values)
+    return collected
+
+
+def write_last_snapshot():
+    """ Bring the snapshot of an exiting process up to date. Processes that never wrote one, like commands, don't. """
+    if _snapshot["writer_pid"] == os.getpid():
+        write_snapshot()
+
+
+atexit.register(write_last_snapshot)
+
+
+# EXPOSITION
+
+def format_labels(names, values, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render(collected: dict) -> str:
+    """ Render the collected values in the Prometheus text exposition format. """
+    by_metric = {}
+    for (name, labels), value in sorted(collected.items(), key=lambda item: (item[0][0], item[0][1])):
+        by_metric.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, metric in REGISTRY.metrics.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for labels, value in by_metric.get(name, ()):
+            if metric.kind == "histogram":
+                cumulative = 0
+                for bound, count in zip((*metric.buckets, "+Inf"), value[:-1]):
+                    cumulative += count
+                    bucket_labels = format_labels(metric.labelnames, labels, 'le="%s"' % bound)
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(metric.labelnames, labels)} {value[-1]}")
+                lines.append(f"{name}_count{format_labels(metric.labelnames, labels)} {cumulative}")
+            else:
+                lines.append(f"{name}{format_labels(metric.labelnames, labels)} {value}")
+
+    hits = collected.get((CACHE_REQUESTS.name, ("hit",)), 0)
+    misses = collected.get((CACHE_REQUESTS.name, ("miss",)), 0)
+    lines.append("# HELP django_redis_cache_hit_ratio The share of the reads of the django-redis cache that were hits.")
+    lines.append("# TYPE django_redis_cache_hit_ratio gauge")
+    lines.append(f"django_redis_cache_hit_ratio {hits / (hits + misses) if hits + misses else 0.0}")
+    return "\n".join(lines) + "\n"
+
+
+def is_allowed_address(address: str) -> bool:
+    """ Return whether an IP address is in one of the networks of settings.METRICS_ALLOWED_NETWORKS. """
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """
+    Serve the metrics of all the workers to the addresses of settings.METRICS_ALLOWED_NETWORKS, and to requests
+    sending settings.METRICS_TOKEN as a bearer token. With neither set, the metrics are not served at all.
+    """
+    if not is_allowed_address(request.META.get("REMOTE_ADDR", "")):
+        if not settings.METRICS_TOKEN:
+            return HttpResponse(status=403)
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+            return HttpResponse(status=401)
+    write_snapshot()
+    return HttpResponse(render(collect_all()), content_type=CONTENT_TYPE)
+
+
+# RECORDING
+
+def get_view_labels(request) -> tuple:
+    """ Return the view and action a request was routed to, such as ("FeedbackView", "list"). """
+    match = request.resolver_match
+    if match is None:
+        return "unmatched", ""
+    view_class = getattr(match.func, "cls", None) or getattr(match.func, "view_class", None)
+    method = request.method.lower()
+    if view_class is None:
+        return match.func.__name__, method
+    return view_class.__name__, (getattr(match.func, "actions", None) or {}).get(method, method)
+
+
+class MetricsMiddleware:
+    """ Record the latency and status of every request, and whether it found its database connections open. """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for alias in connections:
+            if connections[alias].connection is not None:
+                DB_CONNECTIONS_REUSED.inc(alias)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view, action = get_view_labels(request)
+        HTTP_REQUESTS.inc(view, action, request.method, str(response.status_code))
+        HTTP_REQUEST_DURATION.observe(duration, view, action)
+        start_snapshot_writer()
+        return response
+
+
+class InstrumentedRedisCache(RedisCache):
+    """ The django-redis cache, counting the hits and misses of its reads. """
+    missing = object()
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, self.missing, version=version, client=client)
+        # None is also returned when Redis is unreachable, and is counted as a miss.
+        CACHE_REQUESTS.inc("miss" if value is self.missing or value is None else "hit")
+        return default if value is self.missing else value
+
+    def get_many(self, keys, version=None, client=None):
+        values = super().get_many(keys, version=version, client=client)
+        CACHE_REQUESTS.inc("hit", amount=len(values))
+        CACHE_REQUESTS.inc("miss", amount=len(keys) - len(values))
+        return values
+
+
+_task_starts = {}
+
+
+def task_prerun(sender=None, task_id=None, **kwargs):
+    if sender.name in settings.METRICS_CELERY_TASKS:
+        _task_starts[task_id] = time.perf_counter()
+
+
+def task_postrun(sender=None, task_id=None, state=None, **kwargs):
+    start = _task_starts.pop(task_id, None)
+    if start is None:
+        return
+    CELERY_TASK_DURATION.observe(time.perf_counter() - start, sender.name)
+    CELERY_TASKS.inc(sender.name, (state or "unknown").lower())
+    start_snapshot_writer()
+
+
+def count_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS_OPENED.inc(connection.alias)
+
+
+def connect_signals():
+    """ Record the Celery task and database connection metrics. Called once the apps are ready. """
+    celery_signals.task_prerun.connect(task_prerun, weak=False, dispatch_uid="metrics_task_prerun")
+    celery_signals.task_postrun.connect(task_postrun, weak=False, dispatch_uid="metrics_task_postrun")
+    connection_created.connect(count_connection, dispatch_uid="metrics_connection_created")
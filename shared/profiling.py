@@ -0,0 +1,169 @@
+"""
+Per-request SQL accounting, sampled so it can stay on in production.
+
+For a sampled request, RequestProfilingMiddleware records the number of SQL queries, the time spent in the
+database and the time spent serializing. It sends them in a Server-Timing header and logs them as a JSON line
+on the "shared.profiling" logger. Queries are counted through Connection.execute_wrapper(), so nothing is
+kept per query but a counter per query shape.
+
+A query shape is the SQL with its parameters left as placeholders. A shape that runs
+settings.REQUEST_PROFILING_N_PLUS_ONE_THRESHOLD times or more in one request is logged as an N+1 warning,
+with the line of project code that ran it the second time. That is usually the loop, or the serializer
+method, to move to a prefetch.
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+current_profile = ContextVar("current_profile", default=None)
+
+# IN lists and multi-row VALUES differ in length between calls of the same code.
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+VALUES_LIST = re.compile(r"VALUES (?:\((?:%s, )*%s\), )*\((?:%s, )*%s\)")
+
+
+def get_query_shape(sql: str) -> str:
+    return VALUES_LIST.sub("VALUES (...)", IN_LIST.sub("IN (...)", sql))
+
+
+def get_call_site() -> str:
+    """ Return the innermost frame of project code, outside of the installed packages and this module. """
+    project_dir = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(project_dir) and "site-packages" not in filename and filename != __file__:
+            return f"{os.path.relpath(filename, project_dir)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+class RequestProfile:
+    """ The SQL queries and serializer time of one request. Installed as the execute wrapper of every connection. """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.shapes = Counter()
+        self.call_sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            shape = get_query_shape(sql)
+            self.shapes[shape] += 1
+            if self.shapes[shape] == 2:
+                self.call_sites[shape] = get_call_site()
+
+    def get_repeated_queries(self, threshold: int) -> list:
+        """
+        :param threshold: The number of runs from which a query shape is repeated
+        :return: A list of (query shape, runs, call site), most run first
+        """
+        return [
+            (shape, count, self.call_sites.get(shape, "unknown"))
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+    def get_server_timing(self, duration: float) -> str:
+        return ", ".join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f"serializer;dur={self.serializer_time * 1000:.1f}",
+            f"total;dur={duration * 1000:.1f}",
+        ))
+
+
+@contextmanager
+def serializer_timer():
+    """ Add the time of the block to the serializer time of the current request, unless it is nested in another. """
+    profile = current_profile.get()
+    if profile is None or profile.serializing:
+        yield
+        return
+    profile.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serializer_time += time.perf_counter() - start
+        profile.serializing = False
+
+
+def install_serializer_timer():
+    """ Time every access to the data of a DRF serializer. Nested serializers are timed as part of their parent. """
+    data = serializers.BaseSerializer.data
+    if getattr(data.fget, "timed", False):
+        return
+
+    def timed_data(self):
+        with serializer_timer():
+            return data.fget(self)
+
+    timed_data.timed = True
+    serializers.BaseSerializer.data = property(timed_data)
+
+
+class RequestProfilingMiddleware:
+    """
+    Profile a share of requests, set by settings.REQUEST_PROFILING_SAMPLE_RATE. Requests that are not sampled
+    only cost a random number.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_serializer_timer()
+
+    def __call__(self, request):
+        sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        duration = time.perf_counter() - start
+
+        repeated = profile.get_repeated_queries(settings.REQUEST_PROFILING_N_PLUS_ONE_THRESHOLD)
+        response["Server-Timing"] = profile.get_server_timing(duration)
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 1),
+            "queries": profile.queries,
+            "db_ms": round(profile.db_time * 1000, 1),
+            "serializer_ms": round(profile.serializer_time * 1000, 1),
+            "repeated_queries": len(repeated),
+        }))
+        for shape, count, call_site in repeated:
+            logger.warning(
+                "N+1 queries in %s %s: ran %d times from %s: %s", request.method, request.path, count, call_site, shape
+            )
+        return response
@@ -1,9 +1,11 @@
 from rest_framework import serializers
 
+from shared.compiled import CompiledSerializer
+from shared.fieldsets import FieldsetSerializerMixin, get_selected_columns
 from user.models import User
 
 
-class BasicListUserSerializer(serializers.ModelSerializer):
+class BasicListUserSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = (
@@ -12,6 +14,35 @@ class BasicListUserSerializer(serializers.ModelSerializer):
         )
 
 
+def get_users_by_id(user_ids, fieldset=None) -> dict:
+    """
+    Resolve a batch of user ids to their BasicListUserSerializer data with a single in_bulk query.
+    :param user_ids: An iterable of user UUIDs. Duplicates and None values are ignored.
+    :param fieldset: The sparse fieldset of the users (shared.fieldsets). Only the selected columns are read.
+    :return: A dict mapping each found user id to the serialized user.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    serializer = BasicListUserSerializer(context={"fieldset": fieldset})
+    users = User.objects.only("id", *get_selected_columns(serializer, User)).in_bulk(user_ids)
+    return {user_id: serializer.to_representation(user) for user_id, user in users.items()}
+
+
+class CompiledBasicListUserSerializer(CompiledSerializer):
+    serializer_class = BasicListUserSerializer
+
+
+def get_compiled_users_by_id(user_ids, fieldset=None) -> dict:
+    """ get_users_by_id() with CompiledBasicListUserSerializer, for the compiled list serializers. """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    compiled = CompiledBasicListUserSerializer(context={"fieldset": fieldset})
+    rows = list(compiled.get_rows(User.objects.filter(pk__in=user_ids)))
+    return {row["id"]: user for row, user in zip(rows, compiled.serialize(rows))}
+
+
 class BrandUserSerializer(serializers.ModelSerializer):
     """ Define the representation of Brands. """
 
@@ -0,0 +1,266 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from feedback.models import FeedbackModel, ImageModel
+from timeline.models import TimelineModel
+from user.models import User
+
+from . import metrics
+from .compiled import CompiledSerializer
+from .metrics import (
+    CACHE_REQUESTS, HTTP_REQUEST_DURATION, HTTP_REQUESTS, REQUEST_BUCKETS, REGISTRY, RESPONSE_CACHE_REQUESTS, Histogram,
+    Registry, merge_values, render,
+)
+
+
+class MergeValuesTests(SimpleTestCase):
+
+    def test_counters_are_added_and_histograms_added_per_bucket(self):
+        into = {("requests", ("a",)): 1, ("duration", ("a",)): [1, 0, 2, 0.5]}
+        merge_values(into, {
+            ("requests", ("a",)): 2,
+            ("requests", ("b",)): 3,
+            ("duration", ("a",)): [0, 1, 1, 0.25],
+        })
+        self.assertEqual(into, {
+            ("requests", ("a",)): 3,
+            ("requests", ("b",)): 3,
+            ("duration", ("a",)): [1, 1, 3, 0.75],
+        })
+
+    def test_new_histograms_are_copied(self):
+        counts = [1, 0, 0.1]
+        into = {}
+        merge_values(into, {("duration", ()): counts})
+        merge_values(into, {("duration", ()): counts})
+        self.assertEqual(into, {("duration", ()): [2, 0, 0.2]})
+        self.assertEqual(counts, [1, 0, 0.1])
+
+
+class HistogramTests(SimpleTestCase):
+
+    def test_values_on_a_bound_are_counted_in_its_bucket(self):
+        registry = Registry()
+        histogram = Histogram("test_seconds", "Test values.", ("view",), buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.1, 0.5, 1.0, 2.0):
+            histogram.observe(value, "FeedbackView")
+        counts = registry.collect()[("test_seconds", ("FeedbackView",))]
+        # One count per bucket, then the count past the last bucket, then the sum.
+        self.assertEqual(counts[:-1], [2, 2, 1])
+        self.assertAlmostEqual(counts[-1], 3.65)
+
+
+class RenderTests(SimpleTestCase):
+
+    def test_render(self):
+        duration = [0] * (len(REQUEST_BUCKETS) + 2)
+        duration[0], duration[2], duration[-2], duration[-1] = 1, 1, 1, 12.5
+        text = render({
+            (HTTP_REQUESTS.name, ("FeedbackView", "list", "GET", "200")): 3,
+            (HTTP_REQUESTS.name, ('Say "hi"', "", "GET", "404")): 1,
+            (HTTP_REQUEST_DURATION.name, ("FeedbackView", "list")): duration,
+            (CACHE_REQUESTS.name, ("hit",)): 3,
+            (CACHE_REQUESTS.name, ("miss",)): 1,
+        })
+        lines = text.splitlines()
+        self.assertTrue(text.endswith("\n"))
+        self.assertIn("# TYPE http_requests_total counter", lines)
+        self.assertIn('http_requests_total{view="FeedbackView",action="list",method="GET",status="200"} 3', lines)
+        self.assertIn('http_requests_total{view="Say \\"hi\\"",action="",method="GET",status="404"} 1', lines)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", lines)
+        bucket = 'http_request_duration_seconds_bucket{view="FeedbackView",action="list",le="%s"} %d'
+        self.assertIn(bucket % (0.005, 1), lines)
+        self.assertIn(bucket % (0.01, 1), lines)
+        self.assertIn(bucket % (0.025, 2), lines)
+        self.assertIn(bucket % (10.0, 2), lines)
+        self.assertIn(bucket % ("+Inf", 3), lines)
+        self.assertIn('http_request_duration_seconds_sum{view="FeedbackView",action="list"} 12.5', lines)
+        self.assertIn('http_request_duration_seconds_count{view="FeedbackView",action="list"} 3', lines)
+        self.assertIn("django_redis_cache_hit_ratio 0.75", lines)
+
+    def test_hit_ratio_without_cache_reads(self):
+        self.assertIn("django_redis_cache_hit_ratio 0.0", render({}).splitlines())
+
+
+class CollectAllTests(SimpleTestCase):
+
+    def setUp(self):
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.metrics_dir.cleanup)
+        self.registry = Registry()
+        self.registry.get_values()[("requests", ("a",))] = 1
+        self.live_pids = {101, 102}
+
+    def write(self, name, content):
+        with open(os.path.join(self.metrics_dir.name, name), "w") as snapshot_file:
+            snapshot_file.write(content)
+
+    def collect_all(self):
+        with override_settings(METRICS_DIR=self.metrics_dir.name), \
+                mock.patch.object(metrics, "REGISTRY", self.registry), \
+                mock.patch.object(metrics, "is_process_alive", side_effect=lambda pid: pid in self.live_pids):
+            return metrics.collect_all()
+
+    def get_snapshots(self) -> list:
+        return sorted(name for name in os.listdir(self.metrics_dir.name) if name.endswith(".json"))
+
+    def test_snapshots_of_other_processes_are_added(self):
+        self.write("101-aaaa.json", json.dumps([["requests", ["a"], 2], ["duration", [], [1, 0, 0.5]]]))
+        self.write("102-bbbb.json", json.dumps([["requests", ["a"], 3], ["duration", [], [0, 1, 2.0]]]))
+        self.assertEqual(self.collect_all(), {("requests", ("a",)): 6, ("duration", ()): [1, 1, 2.5]})
+
+    def test_partial_and_unreadable_snapshots_are_skipped(self):
+        self.write("101-aaaa.json", json.dumps([["requests", ["a"], 2]]))
+        self.write("102-bbbb.json.tmp", json.dumps([["requests", ["a"], 10]]))
+        self.write("102-cccc.json", "[[")
+        self.assertEqual(self.collect_all(), {("requests", ("a",)): 3})
+
+    def test_snapshots_of_exited_processes_are_folded_into_one(self):
+        self.write("101-aaaa.json", json.dumps([["requests", ["a"], 2]]))
+        self.write("201-bbbb.json", json.dumps([["requests", ["a"], 3], ["duration", [], [1, 0, 0.5]]]))
+        self.write("202-cccc.json", json.dumps([["requests", ["a"], 4], ["duration", [], [0, 1, 2.0]]]))
+        expected = {("requests", ("a",)): 10, ("duration", ()): [1, 1, 2.5]}
+        self.assertEqual(self.collect_all(), expected)
+        self.assertEqual(self.get_snapshots(), ["101-aaaa.json", "exited.json"])
+        # Folding again, after a worker restarts, adds the new exited process once.
+        self.live_pids = {102}
+        self.write("102-dddd.json", json.dumps([["requests", ["a"], 5]]))
+        self.assertEqual(self.collect_all(), {**expected, ("requests", ("a",)): 15})
+        self.assertEqual(self.get_snapshots(), ["102-dddd.json", "exited.json"])
+
+    def test_processes_that_were_reaped_are_not_alive(self):
+        child = subprocess.Popen([sys.executable, "-c", ""])
+        child.wait()
+        self.assertTrue(metrics.is_process_alive(os.getpid()))
+        self.assertFalse(metrics.is_process_alive(child.pid))
+
+    def test_fold_interrupted_before_removing_the_snapshots_adds_them_once(self):
+        self.write("201-bbbb.json", json.dumps([["requests", ["a"], 3]]))
+        self.write("exited.json", json.dumps({"values": [["requests", ["a"], 7]], "folded": ["201-bbbb.json"]}))
+        self.assertEqual(self.collect_all(), {("requests", ("a",)): 8})
+        self.assertEqual(self.get_snapshots(), ["exited.json"])
+        self.assertEqual(self.collect_all(), {("requests", ("a",)): 8})
+
+
+class ResponseCacheMetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def get_count(self, result):
+        return REGISTRY.collect().get((RESPONSE_CACHE_REQUESTS.name, ("feedbackmodel.list", result)), 0)
+
+    def test_response_cache_reads_are_counted_by_view(self):
+        hits, misses = self.get_count("hit"), self.get_count("miss")
+        self.client.get("/api/v1/feedback/")
+        self.client.get("/api/v1/feedback/")
+        self.assertEqual(self.get_count("miss") - misses, 1)
+        self.assertEqual(self.get_count("hit") - hits, 1)
+        self.assertIn("response_cache_requests_total", render(REGISTRY.collect()))
+
+
+@override_settings(METRICS_DIR=None)
+class MetricsViewTests(SimpleTestCase):
+
+    def get_status(self, address: str, token: str = None) -> int:
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        return self.client.get("/metrics", REMOTE_ADDR=address, **headers).status_code
+
+    @override_settings(METRICS_TOKEN="metrics-token", METRICS_ALLOWED_NETWORKS=[])
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.get_status("93.184.216.34"), 401)
+        self.assertEqual(self.get_status("10.0.0.12", "wrong-token"), 401)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer metrics-token", REMOTE_ADDR="93.184.216.34")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+
+    @override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_NETWORKS=[])
+    def test_metrics_are_refused_by_default(self):
+        for address in ("127.0.0.1", "10.0.0.12", "93.184.216.34"):
+            with self.subTest(address=address):
+                self.assertEqual(self.get_status(address), 403)
+
+    @override_settings(METRICS_TOKEN="metrics-token", METRICS_ALLOWED_NETWORKS=["127.0.0.1/32", "10.1.0.0/16"])
+    def test_allowed_networks_are_served_without_the_token(self):
+        self.assertEqual(self.get_status("127.0.0.1"), 200)
+        self.assertEqual(self.get_status("10.1.2.3"), 200)
+        self.assertEqual(self.get_status("10.2.0.1"), 401)
+        self.assertEqual(self.get_status("10.2.0.1", "metrics-token"), 200)
+
+
+class CompiledListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.users = [
+            User.objects.create_user(
+                f"user{index}@example.com", password="password", firstname=f"First {index}", lastname="Last",
+                phone_no="0800" if index else None, dp=f"dp/user{index}.png" if index else None,
+                social_account_dict={"github": f"user{index}"},
+            )
+            for index in range(3)
+        ]
+        images = ImageModel.objects.bulk_create([
+            ImageModel(
+                image=f"images/{index}.png", variants_source=f"images/{index}.png",
+                variants={"thumbnail": f"images/variants/{index}-thumbnail.webp"} if index % 2 else {},
+            )
+            for index in range(4)
+        ])
+        for index, user in enumerate(cls.users):
+            feedback = FeedbackModel.objects.create(
+                owner=user.id, title=f"App {index}", description="Caf\u00e9 \"quoted\"\n", clicks=index or None,
+                category="EDUCATION" if index else "", created_at=now - timedelta(minutes=index),
+            )
+            feedback.screenshot.set(images[index:index + 2])
+        TimelineModel.objects.bulk_create([
+            TimelineModel(
+                user=user.id, app=feedback_id, entity="APP", category="LIST_APP", created_at=now - timedelta(minutes=index),
+            )
+            for index, (user, feedback_id) in enumerate(
+                zip(cls.users, [*FeedbackModel.objects.values_list("id", flat=True), uuid.uuid4()])
+            )
+        ])
+
+    def get(self, url: str, compiled_views: list):
+        cache.clear()
+        with override_settings(COMPILED_SERIALIZER_VIEWS=compiled_views):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def assertSameBytes(self, view_name: str, url: str):
+        drf_content = self.get(url, [])
+        with mock.patch.object(CompiledSerializer, "serialize", autospec=True, side_effect=CompiledSerializer.serialize) as serialize:
+            compiled_content = self.get(url, [view_name])
+        serialize.assert_called()
+        self.assertEqual(compiled_content, drf_content)
+
+    def test_feedback_list(self):
+        for query in (
+            "", "?fields=id,title,owner.email,screenshot", "?omit=owner,description", "?omit=owner.email",
+            "?image_size=thumbnail", "?image_size=medium", "?image_size=large", "?fields=screenshot&image_size=large",
+        ):
+            with self.subTest(query=query):
+                self.assertSameBytes("feedbackmodel.list", f"/api/v1/feedback/{query}")
+
+    def test_timeline_list(self):
+        for query in ("", f"?user={self.users[1].id}&page_size=1", "?ordering=created_at"):
+            with self.subTest(query=query):
+                self.assertSameBytes("timelinemodel.list", f"/api/v1/timeline/{query}")
+
+    def test_user_list(self):
+        for query in ("", "?fields=id,email,dp", "?omit=social_account_dict,dp"):
+            with self.subTest(query=query):
+                self.assertSameBytes("user.list", f"/api/v1/user/{query}")
@@ -0,0 +1,124 @@
+"""
+Per-user timeline feeds materialized in Redis.
+
+Each user's newest TIMELINE_FEED_SIZE timeline events are kept in a sorted set scored by their created_at
+timestamp, with the serialized timeline rows as members, so the first page of a user's timeline is one
+ZREVRANGE whatever the size of the timeline table. A feed is built from the table the first time it is
+read, new events are added to the feeds that exist or are being built, and an unused feed expires after
+TIMELINE_FEED_TTL.
+The app and user of each entry are resolved when the page is read, so they are never stale.
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class RedisFeedStore:
+    # How long a feed is marked as being built, far longer than reading a feed from the table takes.
+    build_timeout = 60  # seconds
+
+    def __init__(self, alias: str, size: int, ttl: int):
+        from django_redis import get_redis_connection
+        self.client = get_redis_connection(alias)
+        self.size = size
+        self.ttl = ttl
+
+    @staticmethod
+    def get_key(user_id) -> str:
+        return f"timeline-feed:{user_id}"
+
+    @staticmethod
+    def get_building_key(user_id) -> str:
+        return f"timeline-feed-building:{user_id}"
+
+    @staticmethod
+    def get_members(entries: list) -> dict:
+        return {json.dumps(entry): parse_datetime(entry["created_at"]).timestamp() for entry in entries}
+
+    def add(self, entries: list):
+        """
+        Add serialized timeline rows to the existing feeds of their users, dropping the oldest past the cap.
+        Users without a feed are skipped, their feed is built with these rows on its first read, unless it is
+        being built, when the rows may have been committed after the build read the table.
+        """
+        user_ids = list({entry["user"] for entry in entries})
+        pipeline = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.exists(self.get_key(user_id), self.get_building_key(user_id))
+        existing = [user_id for user_id, exists in zip(user_ids, pipeline.execute()) if exists]
+        for user_id in existing:
+            key = self.get_key(user_id)
+            pipeline.zadd(key, self.get_members([entry for entry in entries if entry["user"] == user_id]))
+            pipeline.zremrangebyrank(key, 0, -self.size - 1)
+            pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def start_build(self, user_id):
+        """ Mark the feed of a user as being built, so the rows added meanwhile are added to it. """
+        self.client.set(self.get_building_key(user_id), 1, ex=self.build_timeout)
+
+    def finish_build(self, user_id, entries: list):
+        """
+        Add the serialized timeline rows read by a build to the feed of a user, and end the build.
+        The rows are added to the feed instead of replacing it, so the rows added during the build are kept.
+        """
+        key = self.get_key(user_id)
+        pipeline = self.client.pipeline(transaction=True)
+        if entries:
+            pipeline.zadd(key, self.get_members(entries))
+            pipeline.zremrangebyrank(key, 0, -self.size - 1)
+            pipeline.expire(key, self.ttl)
+        pipeline.delete(self.get_building_key(user_id))
+        pipeline.execute()
+
+    def read(self, user_id, count: int):
+        """
+        Return the newest `count` serialized timeline rows of the user, newest first,
+        or None if the user has no feed.
+        """
+        members = self.client.zrevrange(self.get_key(user_id), 0, count - 1)
+        if not members:
+            return None
+        return [json.loads(member) for member in members]
+
+
+def get_feed_store():
+    """ Return the feed store, or None if the feed cache is not django-redis and the feeds are disabled. """
+    alias = settings.TIMELINE_FEED_CACHE_ALIAS
+    if not hasattr(getattr(caches[alias], "client", None), "get_client"):
+        return None
+    return RedisFeedStore(alias, settings.TIMELINE_FEED_SIZE, settings.TIMELINE_FEED_TTL)
+
+
+def serialize_timelines(timelines) -> list:
+    from timeline.serializers import BasicTimelineSerializer
+    return BasicTimelineSerializer(instance=timelines, many=True).data
+
+
+def build_feed(store, user_id) -> list:
+    """
+    Build the feed of a user from the newest rows of the timeline table.
+    :return: The serialized timeline rows read from the table, newest first.
+    """
+    from timeline.models import TimelineModel
+
+    store.start_build(user_id)
+    entries = serialize_timelines(TimelineModel.objects.filter(user=user_id).order_by("-created_at", "-id")[:store.size])
+    store.finish_build(user_id, entries)
+    return entries
+
+
+def add_to_feeds(timelines):
+    """ Add timeline rows to the feeds of their users. A failure is logged, the feeds expire and are rebuilt. """
+    store = get_feed_store()
+    if store is None or not timelines:
+        return
+    try:
+        store.add(serialize_timelines(timelines))
+    except Exception as exc:
+        logger.warning("Unable to add %s events to the timeline feeds: %s", len(timelines), exc)
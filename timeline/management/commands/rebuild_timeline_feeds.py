@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from timeline.feed import build_feed, get_feed_store
+from timeline.models import TimelineModel
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user timeline feeds from the timeline table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', help='Only rebuild the feed of this user id. Can be repeated')
+
+    def handle(self, *args, **kwargs):
+        store = get_feed_store()
+        if store is None:
+            self.stdout.write(self.style.ERROR("The timeline feed cache is not a Redis cache, so there are no feeds to rebuild."))
+            return
+
+        user_ids = kwargs['user'] or TimelineModel.objects.values_list('user', flat=True).distinct().order_by().iterator()
+        rebuilt = 0
+        for user_id in user_ids:
+            build_feed(store, user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timeline feeds successfully."))
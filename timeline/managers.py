@@ -1,14 +1,76 @@
-from django.db import models
+import logging
+
+from django.db import connection, models, transaction
+
+from shared.cache import invalidate_tags
+from timeline.feed import add_to_feeds
+
+logger = logging.getLogger(__name__)
+
+
+def drain_after_commit():
+    """ Ask a worker to drain the outbox once the current transaction commits. """
+
+    def _drain():
+        from timeline.tasks import drain_timeline_outbox
+        try:
+            drain_timeline_outbox.delay()
+        except Exception as exc:
+            # The periodic drain picks the events up, so a missing worker only delays them.
+            logger.warning("Unable to queue the timeline outbox drain: %s", exc)
+
+    transaction.on_commit(_drain)
 
 
 class TimelineModelManager(models.Manager):
+    """
+    Timeline events are not inserted directly. They are appended to the TimelineOutboxModel in the
+    caller's transaction, so an event exists if and only if the change it records was committed, and
+    the outbox is drained into the timeline in batches in the background.
+    """
+
+    def get_outbox_model(self):
+        return self.model._meta.apps.get_model("timeline", "TimelineOutboxModel")
 
     def create_user_timeline(self, user_id, category):
-        timeline = self.model(user=user_id, entity="USER", category=category)
-        timeline.save()
-        return timeline
+        event = self.get_outbox_model().objects.create(user=user_id, entity="USER", category=category)
+        drain_after_commit()
+        return event
 
     def create_app_timeline(self, user_id, app_id, category):
-        timeline = self.model(user=user_id, app=app_id, entity="APP", category=category)
-        timeline.save()
-        return timeline
+        event = self.get_outbox_model().objects.create(user=user_id, app=app_id, entity="APP", category=category)
+        drain_after_commit()
+        return event
+
+
+class TimelineOutboxModelManager(models.Manager):
+
+    def drain(self, batch_size: int = 500) -> int:
+        """
+        Move the oldest pending events into the timeline with one bulk INSERT per batch.
+        Each event keeps its id in the timeline, so an event drained twice by concurrent drains is only
+        inserted once.
+        :param batch_size: The number of events moved per transaction
+        :return: The number of events drained
+        """
+        timeline_model = self.model._meta.apps.get_model("timeline", "TimelineModel")
+        fields = ("id", "created_at", "user", "app", "entity", "category")
+        drained = 0
+        while True:
+            with transaction.atomic():
+                pending = self.order_by("created_at", "id")
+                if connection.features.has_select_for_update_skip_locked:
+                    pending = pending.select_for_update(skip_locked=True)
+                events = list(pending.values(*fields)[:batch_size])
+                if not events:
+                    break
+                timelines = timeline_model.objects.bulk_create(
+                    [timeline_model(**event) for event in events], ignore_conflicts=True
+                )
+                self.filter(pk__in=[event["id"] for event in events]).delete()
+                invalidate_tags("timeline")
+                transaction.on_commit(lambda timelines=timelines: add_to_feeds(timelines))
+            drained += len(events)
+            if len(events) < batch_size:
+                break
+        return drained
@@ -4,7 +4,7 @@ from django.db import models
 from django.utils import timezone
 
 from timeline.enums import TIMELINE_ENTITY, TIMELINE_CATEGORY
-from timeline.managers import TimelineModelManager
+from timeline.managers import TimelineModelManager, TimelineOutboxModelManager
 
 
 class TimelineModel(models.Model):
@@ -28,13 +28,43 @@ class TimelineModel(models.Model):
     category = models.CharField(max_length=20, choices=TIMELINE_CATEGORY, default="")
 
     class Meta:
-        ordering = ("-created_at",)
+        ordering = ("-created_at", "-id")
         indexes = [
             models.Index(
                 fields=("user", "app", "entity", "category"),
                 name="timeline_model_index",
-            )
+            ),
+            # Back the (created_at, id) keyset pagination of the timeline feed.
+            models.Index(fields=("-created_at", "-id"), name="timeline_created_index"),
+            models.Index(fields=("user", "-created_at", "-id"), name="timeline_user_created_index"),
         ]
 
     def __str__(self):
         return f"{self.entity} {self.category} timeline"
+
+
+class TimelineOutboxModel(models.Model):
+    """
+    Timeline events waiting to be written to the TimelineModel.
+    Rows are appended in the transaction of the change they record and removed once drained.
+    """
+
+    objects = TimelineOutboxModelManager()
+
+    id = models.UUIDField(
+        primary_key=True, default=uuid.uuid4, editable=False, null=False
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    user = models.UUIDField()
+    app = models.UUIDField(null=True)
+    entity = models.CharField(max_length=4, choices=TIMELINE_ENTITY, default="")
+    category = models.CharField(max_length=20, choices=TIMELINE_CATEGORY, default="")
+
+    class Meta:
+        ordering = ("created_at", "id")
+        indexes = [
+            models.Index(fields=("created_at", "id"), name="timeline_outbox_created_index"),
+        ]
+
+    def __str__(self):
+        return f"{self.entity} {self.category} timeline event"
@@ -1,22 +1,101 @@
-from django.shortcuts import get_object_or_404
+import uuid
+
+from django.db import models
 from rest_framework import serializers
 
 from feedback.models import FeedbackModel
-from feedback.serializers import BasicListFeedbackSerializer
-from shared.serializers import BasicListUserSerializer
-from user.models import User
+from feedback.serializers import BasicListFeedbackSerializer, CompiledBasicListFeedbackSerializer
+from shared.compiled import CompiledSerializer
+from shared.serializers import get_compiled_users_by_id, get_users_by_id
 from .models import TimelineModel
 
 
+def get_feedback_by_id(feedback_ids) -> dict:
+    """
+    Resolve a batch of feedback ids to their BasicListFeedbackSerializer data with a single in_bulk query.
+    :param feedback_ids: An iterable of feedback UUIDs. Duplicates and None values are ignored.
+    :return: A dict mapping each found feedback id to the serialized feedback.
+    """
+    feedback_ids = {feedback_id for feedback_id in feedback_ids if feedback_id is not None}
+    if not feedback_ids:
+        return {}
+    feedback_objs = FeedbackModel.objects.with_screenshots().in_bulk(feedback_ids)
+    return {
+        feedback_id: BasicListFeedbackSerializer(instance=feedback).data
+        for feedback_id, feedback in feedback_objs.items()
+    }
+
+
+def hydrate_timeline_entries(entries) -> list:
+    """
+    Resolve the app and user of serialized timeline rows with one query each, like ListTimelineSerializer.
+    :param entries: BasicTimelineSerializer data, such as the entries of a timeline feed
+    :return: The entries with their app and user serialized
+    """
+    apps = get_feedback_by_id(uuid.UUID(entry["app"]) for entry in entries if entry["app"])
+    users = get_users_by_id(uuid.UUID(entry["user"]) for entry in entries)
+    return [
+        {
+            **entry,
+            "app": apps.get(uuid.UUID(entry["app"])) if entry["app"] else None,
+            "user": users.get(uuid.UUID(entry["user"])),
+        }
+        for entry in entries
+    ]
+
+
+class BasicTimelineSerializer(serializers.ModelSerializer):
+    """ Returns a timeline row alone, as it is stored in the timeline feeds """
+
+    class Meta:
+        model = TimelineModel
+        fields = "__all__"
+
+
+class TimelineListSerializer(serializers.ListSerializer):
+    """
+    Resolves the apps and users of every timeline row on the page with one query each,
+    instead of two lookups per row.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        timeline_list = list(iterable)
+        self.child.apps = get_feedback_by_id(timeline.app for timeline in timeline_list)
+        self.child.users = get_users_by_id(timeline.user for timeline in timeline_list)
+        return [self.child.to_representation(timeline) for timeline in timeline_list]
+
+
 class ListTimelineSerializer(serializers.ModelSerializer):
     """ Returns a serialized list of App TimelineModel """
+    apps = None
+    users = None
 
     class Meta:
         model = TimelineModel
         fields = "__all__"
+        list_serializer_class = TimelineListSerializer
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data["app"] = BasicListFeedbackSerializer(instance=get_object_or_404(FeedbackModel, pk=instance.app)).data
-        data["user"] = BasicListUserSerializer(instance=get_object_or_404(User, pk=instance.get("owner"))).data
+        apps = self.apps if self.apps is not None else get_feedback_by_id([instance.app])
+        users = self.users if self.users is not None else get_users_by_id([instance.user])
+        data["app"] = apps.get(instance.app)
+        data["user"] = users.get(instance.user)
         return data
+
+
+class CompiledListTimelineSerializer(CompiledSerializer):
+    """ The compiled ListTimelineSerializer. The apps and users of a page are read with one query each. """
+    serializer_class = ListTimelineSerializer
+    nested_fields = ("app", "user")
+
+    def resolve(self, rows, data):
+        app_ids = {row["app"] for row in rows if row["app"] is not None}
+        compiled = CompiledBasicListFeedbackSerializer()
+        app_rows = list(compiled.get_rows(FeedbackModel.objects.filter(pk__in=app_ids))) if app_ids else []
+        apps = {row["id"]: app for row, app in zip(app_rows, compiled.serialize(app_rows))}
+        users = get_compiled_users_by_id(row["user"] for row in rows)
+        for row, timeline in zip(rows, data):
+            timeline["app"] = apps.get(row["app"])
+            timeline["user"] = users.get(row["user"])
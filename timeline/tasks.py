@@ -0,0 +1,9 @@
+from feedback_api.celery import APP
+
+
+@APP.task()
+def drain_timeline_outbox():
+    from timeline.models import TimelineOutboxModel
+
+    """ The background task that writes the pending timeline events to the timeline. """
+    return TimelineOutboxModel.objects.drain()
@@ -1,3 +1,134 @@
-from django.test import TestCase
+import threading
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+
+from .feed import RedisFeedStore, build_feed, serialize_timelines
+from .models import TimelineModel, TimelineOutboxModel
+
+
+def create_events(count: int) -> list:
+    now = timezone.now()
+    return TimelineOutboxModel.objects.bulk_create([
+        TimelineOutboxModel(
+            user=uuid.uuid4(), app=uuid.uuid4(), entity="APP", category="LIST_APP",
+            created_at=now + timedelta(seconds=index),
+        )
+        for index in range(count)
+    ])
+
+
+class TimelineOutboxDrainTests(TestCase):
+
+    def test_drain_moves_every_event_in_batches(self):
+        events = create_events(5)
+        self.assertEqual(TimelineOutboxModel.objects.drain(batch_size=2), 5)
+        self.assertFalse(TimelineOutboxModel.objects.exists())
+        self.assertEqual(
+            set(TimelineModel.objects.values_list("id", flat=True)), {event.id for event in events}
+        )
+
+    def test_event_drained_twice_is_inserted_once(self):
+        event, = create_events(1)
+        # An earlier drain inserted the event but its outbox row is still pending.
+        TimelineModel.objects.create(
+            id=event.id, user=event.user, app=event.app, entity=event.entity, category=event.category
+        )
+        self.assertEqual(TimelineOutboxModel.objects.drain(), 1)
+        self.assertEqual(TimelineModel.objects.filter(id=event.id).count(), 1)
+        self.assertFalse(TimelineOutboxModel.objects.exists())
+
+    def test_drain_of_empty_outbox(self):
+        self.assertEqual(TimelineOutboxModel.objects.drain(), 0)
+
+
+class TimelineOutboxConcurrentDrainTests(TransactionTestCase):
+
+    @skipUnlessDBFeature("has_select_for_update_skip_locked")
+    def test_drain_skips_events_locked_by_another_drain(self):
+        events = create_events(4)
+        locked_ids = [event.id for event in events[:2]]
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_locks():
+            try:
+                with transaction.atomic():
+                    list(TimelineOutboxModel.objects.select_for_update().filter(pk__in=locked_ids))
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_locks)
+        holder.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertEqual(TimelineOutboxModel.objects.drain(), 2)
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual(set(TimelineOutboxModel.objects.values_list("id", flat=True)), set(locked_ids))
+        self.assertEqual(
+            set(TimelineModel.objects.values_list("id", flat=True)), {event.id for event in events[2:]}
+        )
+
+
+class RedisFeedStoreTests(TestCase):
+
+    def setUp(self):
+        with mock.patch("django_redis.get_redis_connection", return_value=fakeredis.FakeRedis()):
+            self.store = RedisFeedStore("default", size=3, ttl=60)
+        patcher = mock.patch("timeline.feed.get_feed_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user_id = uuid.uuid4()
+        self.now = timezone.now()
+
+    def create_timeline(self, minutes_ago: int) -> TimelineModel:
+        return TimelineModel.objects.create(
+            user=self.user_id, app=uuid.uuid4(), entity="APP", category="LIST_APP",
+            created_at=self.now - timedelta(minutes=minutes_ago),
+        )
+
+    def read_ids(self) -> list:
+        entries = self.store.read(self.user_id, 10)
+        return entries and [entry["id"] for entry in entries]
+
+    def test_build_keeps_the_newest_rows(self):
+        timelines = [self.create_timeline(minutes_ago) for minutes_ago in range(4)]
+        entries = build_feed(self.store, self.user_id)
+        self.assertEqual([entry["id"] for entry in entries], [str(timeline.id) for timeline in timelines[:3]])
+        self.assertEqual(self.read_ids(), [str(timeline.id) for timeline in timelines[:3]])
+        self.assertFalse(self.store.client.exists(self.store.get_building_key(self.user_id)))
+
+    def test_rows_are_only_added_to_existing_feeds(self):
+        self.store.add(serialize_timelines([self.create_timeline(1)]))
+        self.assertIsNone(self.read_ids())
+
+        build_feed(self.store, self.user_id)
+        newest = self.create_timeline(0)
+        self.store.add(serialize_timelines([newest]))
+        self.assertEqual(self.read_ids()[0], str(newest.id))
+
+    def test_event_drained_while_the_feed_is_built_is_kept(self):
+        oldest = self.create_timeline(5)
+        event = TimelineOutboxModel.objects.create(
+            user=self.user_id, app=uuid.uuid4(), entity="APP", category="LIST_APP", created_at=self.now,
+        )
+        finish_build = self.store.finish_build
+
+        def drain_then_finish_build(user_id, entries):
+            # The drain commits after the build read the table, and before the build stores what it read.
+            with self.captureOnCommitCallbacks(execute=True):
+                TimelineOutboxModel.objects.drain()
+            finish_build(user_id, entries)
+
+        with mock.patch.object(self.store, "finish_build", side_effect=drain_then_finish_build):
+            build_feed(self.store, self.user_id)
+        self.assertEqual(self.read_ids(), [str(event.id), str(oldest.id)])
@@ -1,18 +1,57 @@
+import logging
+import uuid
+
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from feedback.authentication import CachedJWTAuthentication
+from feedback.pagination import NinePagination
+from shared.cache import cache_response
+from shared.compiled import CompiledListMixin
+from timeline.feed import build_feed, get_feed_store
 from timeline.filters import TimelineFilters
 from timeline.models import TimelineModel
-from timeline.serializers import ListTimelineSerializer
+from timeline.serializers import CompiledListTimelineSerializer, ListTimelineSerializer, hydrate_timeline_entries
+
+logger = logging.getLogger(__name__)
 
 
-class TimelineView(viewsets.ReadOnlyModelViewSet):
+class TimelineView(CompiledListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = TimelineModel.objects.all()
     serializer_class = ListTimelineSerializer
-    authentication_classes = [JWTAuthentication]
+    compiled_serializer_class = CompiledListTimelineSerializer
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = []
-    # pagination_class = NinePagination
+    pagination_class = NinePagination
     filterset_class = TimelineFilters
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['entity', 'category']
+
+    @cache_response(tags=("timeline", "feedback"))
+    def list(self, request, *args, **kwargs):
+        return self.list_from_feed(request) or super().list(request, *args, **kwargs)
+
+    def list_from_feed(self, request):
+        """
+        Serve the first page of `?user=<id>` from the user's materialized feed, building it on the first read.
+        :return: The response, or None if the request is not a plain first page of one user's timeline.
+        """
+        if set(request.query_params) != {"user"}:
+            return None
+        try:
+            user_id = uuid.UUID(request.query_params["user"])
+        except ValueError:
+            return None
+        store = get_feed_store()
+        page_size = self.paginator.get_page_size(request)
+        if store is None or not page_size or page_size >= store.size:
+            return None
+        try:
+            entries = store.read(user_id, page_size + 1)
+            if entries is None:
+                entries = build_feed(store, user_id)[:page_size + 1]
+        except Exception as exc:
+            logger.warning("Unable to read the timeline feed of user %s: %s", user_id, exc)
+            return None
+        page = self.paginator.paginate_first_page(entries, request)
+        return self.get_paginated_response(hydrate_timeline_entries(page))
@@ -0,0 +1,91 @@
+"""
+Write-behind bookkeeping timestamps for User.
+
+Issuing a token records the login time in a Redis hash instead of writing the user row.
+flush_activity() periodically moves the buffered timestamps into the database with one
+bulk UPDATE of only the buffered column. Without django-redis there is nowhere to buffer that every
+worker shares, so the timestamp is written directly with a single-column UPDATE instead.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Only timestamps nothing else reads back immediately are buffered. last_resend_code_datetime is
+# signed into the registration codes, so it is always written straight away.
+BUFFERED_FIELDS = ("last_login",)
+FLUSH_BATCH_SIZE = 500
+
+
+def get_key(field: str) -> str:
+    return f"user-activity:{field}"
+
+
+def get_redis_client():
+    """ Return the Redis client of the activity cache, or None if the cache is not django-redis. """
+    alias = settings.USER_ACTIVITY_CACHE_ALIAS
+    if not hasattr(getattr(caches[alias], "client", None), "get_client"):
+        return None
+    from django_redis import get_redis_connection
+    return get_redis_connection(alias)
+
+
+def record_timestamp(user, field: str, value=None):
+    """
+    Set a bookkeeping timestamp on the user, and buffer it to be written by the next flush.
+    :param user: The User instance
+    :param field: One of BUFFERED_FIELDS
+    :param value: The timestamp. Defaults to now.
+    """
+    value = value or timezone.now()
+    setattr(user, field, value)
+    try:
+        client = get_redis_client()
+        if client is not None:
+            client.hset(get_key(field), str(user.pk), value.isoformat())
+            return
+    except Exception as exc:
+        logger.warning("Unable to buffer %s for user %s, writing it directly: %s", field, user.pk, exc)
+    type(user).objects.filter(pk=user.pk).update(**{field: value})
+
+
+def record_last_login(user):
+    """ Record that the user has just logged in. """
+    record_timestamp(user, "last_login")
+
+
+def flush_activity() -> dict:
+    """
+    Write the buffered timestamps to the user table, one bulk UPDATE of the buffered column per batch.
+    The buffer is renamed before it is read, so timestamps recorded during the flush wait for the next one.
+    :return: The number of users updated per field.
+    """
+    from redis.exceptions import ResponseError
+    from user.models import User
+
+    client = get_redis_client()
+    if client is None:
+        return {}
+
+    flushed = {}
+    for field in BUFFERED_FIELDS:
+        key, flushing_key = get_key(field), f"{get_key(field)}:flushing"
+        if not client.exists(flushing_key):
+            try:
+                client.renamenx(key, flushing_key)
+            except ResponseError:
+                # Nothing was recorded since the last flush.
+                flushed[field] = 0
+                continue
+        users = [
+            User(pk=user_id.decode(), **{field: parse_datetime(value.decode())})
+            for user_id, value in client.hgetall(flushing_key).items()
+        ]
+        User.objects.bulk_update(users, [field], batch_size=FLUSH_BATCH_SIZE)
+        client.delete(flushing_key)
+        flushed[field] = len(users)
+    return flushed
@@ -83,12 +83,14 @@ class User(AbstractBaseUser):
         return self.is_admin
 
     def save_last_login(self):
-        self.last_login = timezone.now()
-        self.save()
+        """ Record the login time. It is buffered and written by the periodic flush_user_activity task. """
+        from user.activity import record_last_login
+        record_last_login(self)
 
     def update_last_resend_datetime(self):
+        """ Save the code resend time, and only that column. The registration codes are signed with it. """
         self.last_resend_code_datetime = timezone.now()
-        self.save()
+        self.save(update_fields=["last_resend_code_datetime"])
 
 
 class AccountCodeModel(models.Model):
@@ -10,6 +10,8 @@ from rest_framework.validators import UniqueValidator
 # from rest_framework_simplejwt.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from shared.compiled import CompiledSerializer
+from shared.fieldsets import FieldsetSerializerMixin
 from timeline.models import TimelineModel
 from user.models import User, AccountCodeModel
 from user.tasks import send_new_user_email
@@ -115,7 +117,7 @@ class SignupSerializer(serializers.ModelSerializer):
         return validated_data
 
 
-class ListUserSerializer(serializers.ModelSerializer):
+class ListUserSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         exclude = ("password",)
@@ -130,6 +132,10 @@ class ListUserSerializer(serializers.ModelSerializer):
         return data
 
 
+class CompiledListUserSerializer(CompiledSerializer):
+    serializer_class = ListUserSerializer
+
+
 class CreateUserSerializer(serializers.ModelSerializer):
     """
     The Create User Serializer
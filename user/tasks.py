@@ -26,3 +26,11 @@ def send_reset_email(email_data):
     html_alternative = html_template.render(email_data)
     text_alternative = text_template.render(email_data)
     send_email("New User", email_data.get("email"), html_alternative, text_alternative)
+
+
+@APP.task()
+def flush_user_activity():
+    from user.activity import flush_activity
+
+    """ The periodic task that writes the buffered user login times to the database. """
+    return flush_activity()
@@ -1,18 +1,22 @@
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
+from feedback.authentication import CachedJWTAuthentication
 from feedback.models import FeedbackModel
+from feedback.pagination import NinePagination
 from feedback.serializers import ListFeedbackSerializer
+from shared.compiled import CompiledListMixin
+from shared.fieldsets import FieldsetViewMixin
 from user.models import User
 from user.serializers import (
-    ListUserSerializer, CustomTokenObtainPairSerializer, CreateUserSerializer, VerifyUserSerializer,
+    CompiledListUserSerializer, ListUserSerializer, CustomTokenObtainPairSerializer, CreateUserSerializer, VerifyUserSerializer,
     ResendVerificationCodeSerializer, ForgotPasswordSerializer, VerifyForgotPasswordCodeSerializer,
     SetPasswordSerializer, ChangePasswordSerializer, GenerateStrongPasswordSerializer
 )
@@ -22,9 +26,11 @@ class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
-class UserView(viewsets.ModelViewSet):
+class UserView(FieldsetViewMixin, CompiledListMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = ListUserSerializer
+    compiled_serializer_class = CompiledListUserSerializer
+    compiled_keep = ("id",)
     authentication_classes = []
     permission_classes = (AllowAny,)
     http_method_names = ['get', 'post', 'patch', 'delete']
@@ -32,6 +38,12 @@ class UserView(viewsets.ModelViewSet):
     filterset_fields = ['is_active']
     search_fields = ['email', 'firstname', 'lastname', 'phone']
     ordering_fields = ['created_at', 'last_login', 'email', 'firstname', 'lastname', 'phone']
+    fieldset_actions = ("list", "retrieve", "user_apps", "user_apps_suggestion")
+
+    def get_queryset(self):
+        if self.action in ("list", "retrieve"):
+            return self.prune_queryset(User.objects.all())
+        return User.objects.all()
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -40,7 +52,7 @@ class UserView(viewsets.ModelViewSet):
 
     @action(
         methods=["GET"], detail=False, permission_classes=[IsAuthenticated],
-        authentication_classes=[JWTAuthentication], url_path="me"
+        authentication_classes=[CachedJWTAuthentication], url_path="me"
     )
     def current_user(self, request):
         """
@@ -48,7 +60,8 @@ class UserView(viewsets.ModelViewSet):
         :param request:
         :return: The current logged in user data
         """
-        serializer = self.serializer_class(instance=request.user)
+        # request.user is built from the token claims, so the user row is read here.
+        serializer = self.serializer_class(instance=get_object_or_404(User, pk=request.user.id))
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
     @action(
@@ -129,7 +142,10 @@ class UserView(viewsets.ModelViewSet):
         serializer.save()
         return Response(data={'success': True}, status=status.HTTP_200_OK)
 
-    @action(methods=["GET"], detail=True, url_path="feedback", serializer_class=ListFeedbackSerializer)
+    @action(
+        methods=["GET"], detail=True, url_path="feedback", serializer_class=ListFeedbackSerializer,
+        pagination_class=NinePagination
+    )
     def user_apps(self, request, pk=None):
         """
         Endpoint that returns the list user's feedback
@@ -138,16 +154,26 @@ class UserView(viewsets.ModelViewSet):
         :return: List of User's Apps
         """
         user = self.get_object()
-        apps_list = FeedbackModel.objects.filter(owner=user.pk)
+        fieldset = self.get_fieldset()
+        apps_list = self.prune_queryset(
+            FeedbackModel.objects.for_fieldset(fieldset).filter(owner=user.pk), keep=("id", "created_at")
+        )
         # Paginate queryset
         pages = self.paginate_queryset(apps_list)
+        context = {
+            "request": request, "image_variant": request.query_params.get("image_size", "thumbnail"),
+            "fieldset": fieldset,
+        }
         if pages is not None:
-            serializer = self.serializer_class(apps_list, many=True)
+            serializer = self.serializer_class(pages, many=True, context=context)
             return self.get_paginated_response(serializer.data)
-        serializer = self.serializer_class(instance=apps_list, many=True)
+        serializer = self.serializer_class(instance=apps_list, many=True, context=context)
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
-    @action(methods=["GET"], detail=True, url_path="feedback-suggestion", serializer_class=ListFeedbackSerializer)
+    @action(
+        methods=["GET"], detail=True, url_path="feedback-suggestion", serializer_class=ListFeedbackSerializer,
+        pagination_class=NinePagination
+    )
     def user_apps_suggestion(self, request, pk=None):
         """
         Endpoint that returns feedback suggestions for a user
@@ -159,13 +185,20 @@ class UserView(viewsets.ModelViewSet):
         2. From the list of tags of the user feedback.
         """
         user = self.get_object()
-        apps_list = FeedbackModel.objects.filter(owner=user.pk)
+        fieldset = self.get_fieldset()
+        apps_list = self.prune_queryset(
+            FeedbackModel.objects.for_fieldset(fieldset).filter(owner=user.pk), keep=("id", "created_at")
+        )
         # Paginate queryset
         pages = self.paginate_queryset(apps_list)
+        context = {
+            "request": request, "image_variant": request.query_params.get("image_size", "thumbnail"),
+            "fieldset": fieldset,
+        }
         if pages is not None:
-            serializer = self.serializer_class(apps_list, many=True)
+            serializer = self.serializer_class(pages, many=True, context=context)
             return self.get_paginated_response(serializer.data)
-        serializer = self.serializer_class(instance=apps_list, many=True)
+        serializer = self.serializer_class(instance=apps_list, many=True, context=context)
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
     @action(